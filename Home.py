@@ -1,186 +1,35 @@
 import streamlit as st
-from datetime import date, datetime
-import joblib
+from datetime import datetime
 import numpy as np
-import pickle
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from streamlit_echarts import st_echarts
-import mysql.connector
-import bcrypt
 import random
-import smtplib
-from email.message import EmailMessage
-import json
-import os
-from sklearn.linear_model import LinearRegression  # or whatever model you used
+import time
+import db
+import metrics
+from metrics import timed, timer
+from activity_log import log_event
+from mailer import send_reset_code_email, send_status, start_worker
+from hashing import HashingBusy
+from auth import register_user, confirm_user, authenticate_user, update_user_password, sync_to_mysql
+from model_registry import registry
+from market_data import DEFAULT_CROP, DEFAULT_REGION, available_models, model_for
+from historical import forecast_options, historical_charts, history_features
+from prediction import (model_features, parameter_grid, predict_frame, predict_csv, predict_price, interval_offsets,
+                        response_surface, surface_chart, simulation_summary,
+                        SIMULATION_PERCENTILES)
 
 # ----------------- DATABASE CONNECTION -----------------
-db_connected = False
-db = None
-cursor = None
-
-try:
-    db = mysql.connector.connect(
-        host="localhost",
-        user="root",
-        password="king",
-        database="agri_users",
-        connection_timeout=3
-    )
-    cursor = db.cursor(dictionary=True)
-    db_connected = True
-except:
-    st.warning("MySQL not connected, falling back to JSON.")
-    db_connected = False
-
-# ----------------- LOCAL JSON -----------------
-DATA_FILE = "data.json"
-
-def read_local_data():
-    if not os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "w") as f:
-            json.dump({"users": []}, f)
-    with open(DATA_FILE, "r") as f:
-        return json.load(f)
-
-def write_local_data(data):
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=4)
-
-def sync_to_mysql():
-    if not db_connected:
-        return
-    local_data = read_local_data()
-    for user in local_data.get("users", []):
-        cursor.execute("SELECT * FROM users WHERE email=%s", (user["email"],))
-        if not cursor.fetchone():
-            cursor.execute(
-                "INSERT INTO users (email, password_hash, confirmation_code, confirmed) VALUES (%s, %s, %s, %s)",
-                (user["email"], user["password_hash"], user["confirmation_code"], user.get("confirmed", False))
-            )
-            db.commit()
-
-# ----------------- EMAIL CONFIG -----------------
-EMAIL_ADDRESS = ""
-EMAIL_PASSWORD = ""
-
-def send_confirmation_email(recipient, code):
-    try:
-        msg = EmailMessage()
-        msg["Subject"] = "Confirm your AgriPrice account"
-        msg["From"] = EMAIL_ADDRESS
-        msg["To"] = recipient
-        msg.set_content(f"Your confirmation code is: {code}")
-
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
-            smtp.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            smtp.send_message(msg)
-        return True
-    except Exception as e:
-        st.error(f"Email sending failed: {e}")
-        return False
-
-def send_reset_code_email(recipient, reset_code):
-    try:
-        msg = EmailMessage()
-        msg["Subject"] = "AgriPrice Password Reset Code"
-        msg["From"] = EMAIL_ADDRESS
-        msg["To"] = recipient
-        msg.set_content(f"Use this code to reset your password: {reset_code}")
-
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
-            smtp.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            smtp.send_message(msg)
-        return True
-    except Exception as e:
-        st.error(f"Failed to send reset code: {e}")
-        return False
-
-# ----------------- AUTH FUNCTIONS -----------------
-def register_user(email, password):
-    code = str(random.randint(100000, 999999))
-    password_hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
-    print(f"Code to be sent are: {code}")
-    if db_connected:
-        try:
-            cursor.execute("INSERT INTO users (email, password_hash, confirmation_code) VALUES (%s, %s, %s)",
-                           (email, password_hash, code))
-            db.commit()
-            # send_confirmation_email(email, code)
-            return True , code
-        except mysql.connector.errors.IntegrityError:
-            st.warning("Email already registered.")
-            return False
-    else:
-        data = read_local_data()
-        if any(u["email"] == email for u in data["users"]):
-            st.warning("Email already registered locally.")
-            return False
-        data["users"].append({
-            "email": email,
-            "password_hash": password_hash,
-            "confirmation_code": code,
-            "confirmed": False
-        })
-        write_local_data(data)
-        # send_confirmation_email(email, code)
-        return True, code
-
-def confirm_user(email, code):
-    if db_connected:
-        cursor.execute("SELECT * FROM users WHERE email = %s AND confirmation_code = %s", (email, code))
-        if cursor.fetchone():
-            cursor.execute("UPDATE users SET confirmed = TRUE WHERE email = %s", (email,))
-            db.commit()
-            return True
-        return False
-    else:
-        data = read_local_data()
-        for user in data["users"]:
-            if user["email"] == email and user["confirmation_code"] == code:
-                user["confirmed"] = True
-                write_local_data(data)
-                return True
-        return False
-
-def authenticate_user(email, password):
-    if db_connected:
-        cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
-        user = cursor.fetchone()
-    else:
-        data = read_local_data()
-        user = next((u for u in data["users"] if u["email"] == email), None)
-
-    if user and bcrypt.checkpw(password.encode(), user["password_hash"].encode()):
-        if user.get("confirmed"):
-            return True
-        else:
-            st.warning("Account not confirmed. Check your email.")
-    return False
-
-def update_user_password(email, new_password):
-    hashed = bcrypt.hashpw(new_password.encode(), bcrypt.gensalt()).decode()
-    if db_connected:
-        cursor.execute("UPDATE users SET password_hash=%s WHERE email=%s", (hashed, email))
-        db.commit()
-    else:
-        data = read_local_data()
-        for user in data["users"]:
-            if user["email"] == email:
-                user["password_hash"] = hashed
-        write_local_data(data)
+# Connects in the background so the first page never waits on MySQL's
+# connect timeout; auth uses the local store until the pool is up.
+db.init_pool(wait=False)
+metrics.start_server()
+start_worker()
 
 # ----------------- MODEL LOADING -----------------
-@st.cache_resource
+@timed("load_model")
 def load_model():
-    return joblib.load("model.pkl")
+    return registry.get()
 
-model = load_model()
-saved = joblib.load("model.pkl")
-model = saved["model"]
-data = saved["data"]
 # ----------------- STREAMLIT UI -----------------
 if "authenticated" not in st.session_state:
     st.session_state.authenticated = False
@@ -192,6 +41,8 @@ if "reset_code_sent" not in st.session_state:
     st.session_state.reset_code_sent = False
 
 if not st.session_state.authenticated:
+    if db.ready() and not db.connected():
+        st.warning("MySQL not connected, falling back to the local database.")
     menu = st.sidebar.selectbox("Login / Register", ["Login", "Register", "Reset Password"])
 
     if menu == "Register":
@@ -201,6 +52,7 @@ if not st.session_state.authenticated:
         if st.button("Register"):
             state, user_code = register_user(email, password)
             if state:
+                log_event(email, "Registered")
                 st.success(f"Check your email for confirmation code.{user_code}")
                 st.session_state.registration_email = email
 
@@ -208,6 +60,7 @@ if not st.session_state.authenticated:
             code = st.text_input("Enter confirmation code sent to email")
             if st.button("Confirm"):
                 if confirm_user(st.session_state.registration_email, code):
+                    log_event(st.session_state.registration_email, "Confirmed Email")
                     st.success("Account confirmed. Please login.")
                     st.session_state.registration_email = ""
                 else:
@@ -219,9 +72,10 @@ if not st.session_state.authenticated:
         password = st.text_input("Password", type="password")
         if st.button("Login"):
             if authenticate_user(email, password):
+                log_event(email, "Logged In")
                 st.session_state.authenticated = True
                 st.session_state.user_email = email
-                if db_connected:
+                if db.connected():
                     sync_to_mysql()
             else:
                 st.error("Login failed.")
@@ -230,9 +84,9 @@ if not st.session_state.authenticated:
             if st.button("Send Reset Code"):
                 reset_code = str(random.randint(100000, 999999))
                 st.session_state.generated_code = reset_code
-                if send_reset_code_email(st.session_state.reset_email, reset_code):
-                    st.success("Reset code sent to your email.")
-                    st.session_state.reset_code_sent = True
+                st.session_state.reset_mail_id = send_reset_code_email(st.session_state.reset_email, reset_code)
+                st.success("Reset code is on its way to your email.")
+                st.session_state.reset_code_sent = True
 
     elif menu == "Reset Password":
         st.title("🔁 Reset Password")
@@ -241,26 +95,38 @@ if not st.session_state.authenticated:
             code = str(random.randint(100000, 999999))
             st.session_state.reset_email = email
             st.session_state.generated_code = code
-            if send_reset_code_email(email, code):
-                st.success("Reset code sent to email.")
-                st.session_state.reset_code_sent = True
+            st.session_state.reset_mail_id = send_reset_code_email(email, code)
+            st.success("Reset code is on its way to your email.")
+            st.session_state.reset_code_sent = True
 
         if st.session_state.reset_code_sent:
+            mail = send_status(st.session_state.get("reset_mail_id"))
+            if mail and mail["status"] == "failed":
+                st.error(f"Failed to send reset code: {mail['last_error']}")
+            elif mail:
+                st.caption(f"Email status: {mail['status']}")
             input_code = st.text_input("Enter reset code")
             new_pass = st.text_input("New Password", type="password")
             confirm_pass = st.text_input("Confirm New Password", type="password")
             if st.button("Reset Password"):
                 if input_code == st.session_state.generated_code:
                     if new_pass == confirm_pass:
-                        update_user_password(st.session_state.reset_email, new_pass)
-                        st.success("Password reset successful. You can now login.")
-                        st.session_state.reset_code_sent = False
+                        try:
+                            if update_user_password(st.session_state.reset_email, new_pass):
+                                st.success("Password reset successful. You can now login.")
+                                st.session_state.reset_code_sent = False
+                        except HashingBusy:
+                            st.error("The server is busy. Please try again shortly.")
                     else:
                         st.error("Passwords do not match.")
                 else:
                     st.error("Invalid reset code.")
 
 else:
+    # The model is only needed once logged in
+    saved = load_model()
+    model = saved["model"]
+
     if "page" not in st.session_state:
         st.session_state.page = "Dashboard"
     if "language" not in st.session_state:
@@ -280,6 +146,19 @@ else:
     if st.sidebar.button("⚙️ Setting"):
         st.session_state.page = "Setting"
 
+    # One model per (crop, region), loaded on demand through the LRU cache;
+    # the choice applies to every page
+    crop, region, bundle = DEFAULT_CROP, DEFAULT_REGION, saved
+    choices = available_models()
+    if len(choices) > 1:
+        crops = sorted({c for c, _ in choices})
+        crop = st.sidebar.selectbox("Crop", crops, index=crops.index(DEFAULT_CROP) if DEFAULT_CROP in crops else 0)
+        regions = sorted(r for c, r in choices if c == crop)
+        region = st.sidebar.selectbox("Region", regions,
+                                      index=regions.index(DEFAULT_REGION) if DEFAULT_REGION in regions else 0)
+        bundle = model_for(crop, region)
+        model = bundle["model"]
+
     # Top Bar (Header)
     st.markdown(
         f"<h1 style='color: white; background-color: #28C76F; padding: 10px; border-radius: 5px;'>AgriPrice Predictor ({st.session_state.language})</h1>",
@@ -287,6 +166,9 @@ else:
     )
 
     # ----------------------- Page Routing -----------------------
+    if st.session_state.get("logged_page") != st.session_state.page:
+        log_event(st.session_state.user_email, f"Viewed {st.session_state.page}")
+        st.session_state.logged_page = st.session_state.page
 
     if st.session_state.page == "Dashboard":
          # Get the current hour for a time-based greeting
@@ -324,31 +206,85 @@ else:
         with col11:
             production = st.number_input("Total Production (MT)", value=700506)
         with col22:
-            population = st.number_input("Mbeya Population", value=2730397)
+            population = st.number_input(f"{region} Population", value=2730397)
 
 
         # Predict only if all required values are usable
         try:
-            features = np.array([[selected_year, rainfall, production, population]])
-            predicted_price = model.predict(features)[0]
+            with timer("predict"):
+                predicted_price = predict_price(bundle, selected_year, rainfall, production, population)
+                lower_offset, upper_offset = interval_offsets(bundle)
+            # Widgets elsewhere on the page rerun it too; only a new input counts
+            prediction_inputs = (crop, region, selected_year, rainfall, production, population)
+            if st.session_state.get("logged_prediction") != prediction_inputs:
+                log_event(st.session_state.user_email, "Predicted Price")
+                st.session_state.logged_prediction = prediction_inputs
 
             # Display prediction result
             st.markdown(f"""
             <div style='background-color: #EAF6FF; padding: 15px; border-radius: 10px; margin-top: 20px;'>
                 <h3>🪙 <strong style="color:#000">{predicted_price:,.0f} Tsh per Kilogram</strong></h3>
-                <p style='color: #666;'>Maize, Year {selected_year} Prediction</p>
+                <p style='color: #333;'>Likely range: {predicted_price + lower_offset:,.0f} – {predicted_price + upper_offset:,.0f} Tsh/kg</p>
+                <p style='color: #666;'>{crop.title()}, {region}, Year {selected_year} Prediction</p>
             </div>
             """, unsafe_allow_html=True)
 
-            st.markdown("""
+            metadata = bundle.get("metadata", {})
+            scores = metadata.get("metrics")
+            if scores:
+                accuracy = f"Validation error: ±{scores['mae']:,.0f} Tsh/kg (MAE), R² {scores['r2']:.2f}"
+            elif metadata.get("in_sample"):
+                fit = metadata["in_sample"]
+                accuracy = (f"In-sample error over {metadata['rows_used']:,} rows: ±{fit['mse'] ** 0.5:,.0f} Tsh/kg "
+                            f"(RMSE), R² {fit['r2']:.2f}")
+            else:
+                accuracy = "Validation scores not recorded for this model"
+            st.markdown(f"""
             <div style='background-color: #E3FCEC; padding: 10px; border-radius: 10px; border: 1px solid #28C76F; margin-top: 10px;'>
-                <strong style='color: #28C76F;'>Prediction Confidence: 85%</strong>
+                <strong style='color: #28C76F;'>{accuracy}</strong>
             </div>
             """, unsafe_allow_html=True)
 
         except Exception as e:
             st.error(f"Prediction error: {e}")
 
+        # Whole rainfall × production surface from one batched predict, cached
+        # per model version; hovering the heatmap needs no rerun
+        with st.expander("🗺️ Price surface (rainfall × production)"):
+            try:
+                from streamlit_echarts import st_echarts
+
+                with timer("price_surface"):
+                    surface_options = surface_chart(response_surface(bundle, selected_year, population))
+                st_echarts(options=surface_options, height="520px")
+                st.caption(f"Year {selected_year}, population {population:,.0f}. "
+                           "Axes span the rainfall and production seen in the training data.")
+            except Exception as e:
+                st.error(f"Surface error: {e}")
+
+        # Rainfall/production uncertainty: many sampled scenarios, one chunked predict
+        with st.expander("🎲 Rainfall uncertainty simulation"):
+            s1, s2 = st.columns(2)
+            with s1:
+                n_samples = st.select_slider("Samples", [10_000, 25_000, 50_000, 100_000, 200_000], value=50_000)
+            with s2:
+                sampling = st.radio("Sample rainfall & production from",
+                                    ["Historical data", "Fitted normal distribution"], horizontal=True)
+            try:
+                from streamlit_echarts import st_echarts
+
+                with timer("simulation"):
+                    simulated = simulation_summary(bundle, selected_year, population, n_samples,
+                                                   "empirical" if sampling == "Historical data" else "normal")
+                marks = simulated["percentiles"]
+                for col, pct, mark in zip(st.columns(len(marks)), SIMULATION_PERCENTILES, marks):
+                    col.metric(f"P{pct}", f"{mark:,.0f} Tsh")
+                st_echarts(options=simulated["chart"], height="400px")
+                st.caption(f"{n_samples:,} simulated years at population {population:,.0f}; "
+                           f"mean {simulated['mean']:,.0f}, std {simulated['std']:,.0f} Tsh/kg.")
+            except Exception as e:
+                st.error(f"Simulation error: {e}")
+
         # Influencing factors
         st.markdown("#### Factors influencing Price")
         factors = {
@@ -364,37 +300,51 @@ else:
                 st.markdown(f"<p style='font-size: 16px;'>{label}</p>", unsafe_allow_html=True)
         st.markdown("</div>", unsafe_allow_html=True)
 
+        # Batch mode: many scenarios through one vectorized model.predict
+        with st.expander("📦 Batch prediction"):
+            source = st.radio("Scenarios from", ["Upload CSV", "Parameter grid"], horizontal=True)
+            if source == "Upload CSV":
+                scenarios = st.file_uploader(f"CSV with columns: {', '.join(model_features(model))}", type="csv")
+            else:
+                g1, g2 = st.columns(2)
+                with g1:
+                    year_range = st.slider("Years", 2000, datetime.now().year + 20, (2018, datetime.now().year + 10))
+                    rain_range = st.slider("Rainfall range (mm)", 500, 3000, (1200, 2200))
+                with g2:
+                    prod_range = st.slider("Production range (MT)", 300000, 1200000, (600000, 800000), step=10000)
+                    steps = st.number_input("Steps per range", min_value=2, max_value=200, value=10)
+                scenarios = parameter_grid(
+                    np.arange(year_range[0], year_range[1] + 1),
+                    np.linspace(*rain_range, steps),
+                    np.linspace(*prod_range, steps),
+                    [population],
+                    model_features(model),
+                )
+                st.caption(f"{len(scenarios):,} scenarios")
+
+            if scenarios is not None and st.button("Run batch prediction"):
+                try:
+                    started = time.perf_counter()
+                    if isinstance(scenarios, pd.DataFrame):
+                        csv_text = predict_frame(model, scenarios, interval_offsets(bundle)).to_csv(index=False)
+                    else:
+                        csv_text = "".join(predict_csv(model, scenarios, offsets=interval_offsets(bundle)))
+                    elapsed = time.perf_counter() - started
+                    rows = csv_text.count("\n") - 1
+                    st.caption(f"{rows:,} predictions in {elapsed:.3f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+                    st.download_button("Download predictions (CSV)", csv_text,
+                                       file_name="price_predictions.csv", mime="text/csv")
+                except Exception as e:
+                    st.error(f"Batch prediction error: {e}")
+
     elif st.session_state.page == "Historical Data":
         st.subheader("📊 Historical Data")
 
-        features = ['Rainfall_mm', 'Total_Production_MT', 'Mbeya_Population']
-        target = 'Cost_Tsh_per_kg'
-        year_col = 'Year'
-
-        # Compute yearly averages
-        yearly_avg = data.groupby(year_col).mean().reset_index()
-
-        # Predict next year price using the average of last year features
-        next_year = yearly_avg[year_col].max() + 1
-        last_row = yearly_avg[yearly_avg[year_col] == yearly_avg[year_col].max()]
-        next_features = [[
-            next_year,
-            last_row["Rainfall_mm"].values[0],
-            last_row["Total_Production_MT"].values[0],
-            last_row["Mbeya_Population"].values[0]
-        ]]
-        predicted_next_price = model.predict(next_features)[0]
-
-        # Append predicted row
-        predicted_row = pd.DataFrame({
-            year_col: [next_year],
-            'Rainfall_mm': last_row["Rainfall_mm"].values,
-            'Total_Production_MT': last_row["Total_Production_MT"].values,
-            'Mbeya_Population': last_row["Mbeya_Population"].values,
-            target: [predicted_next_price]
-        })
-        yearly_avg = pd.concat([yearly_avg, predicted_row], ignore_index=True)
+        from streamlit_echarts import st_echarts
 
+        st.caption(f"{crop.title()}, {region}")
+        charts = historical_charts(bundle)
+        features = list(charts)
 
         # Plot 2 charts side by side in each row
         for i in range(0, len(features), 2):
@@ -403,34 +353,36 @@ else:
             def render_chart(col, feature):
                 with col:
                     st.markdown(f" {feature.replace('_', ' ')} vs Price")
-                    options = {
-                        "tooltip": {"trigger": "axis"},
-                        "legend": {"data": [feature, "Price (Tsh/kg)"]},
-                        "xAxis": {"type": "category", "data": yearly_avg[year_col].tolist()},
-                        "yAxis": [
-                            {"type": "value", "name": feature},
-                            {"type": "value", "name": "Price (Tsh/kg)"}
-                        ],
-                        "series": [
-                            {
-                                "name": feature,
-                                "type": "line",
-                                "data": yearly_avg[feature].round(2).tolist(),
-                            },
-                            {
-                                "name": "Price (Tsh/kg)",
-                                "type": "line",
-                                "yAxisIndex": 1,
-                                "data": yearly_avg[target].round(2).tolist(),
-                            },
-                        ],
-                    }
-                    st_echarts(options=options, height="480px")
+                    st_echarts(options=charts[feature], height="480px")
 
             render_chart(col1, features[i])
             if i + 1 < len(features):
                 render_chart(col2, features[i + 1])
 
+        # Multi-year forecast: every scenario-year priced in one model.predict
+        st.markdown("#### 🔮 Multi-year forecast")
+        f1, f2, f3 = st.columns(3)
+        with f1:
+            horizon = st.slider("Years ahead", 1, 30, 10)
+        with f2:
+            n_scenarios = st.slider("Scenarios", 100, 5000, 1000, step=100)
+        with f3:
+            projection = st.radio("Project features by", ["Historical trend", "Custom growth rates"])
+        growth = None
+        if projection == "Custom growth rates":
+            growth_features = history_features(model)
+            rate_cols = st.columns(len(growth_features))
+            growth = [rate_cols[i].number_input(f"{feature.replace('_', ' ')} growth (%/yr)",
+                                                value=0.0, step=0.5, format="%.2f") / 100
+                      for i, feature in enumerate(growth_features)]
+        try:
+            with timer("forecast"):
+                options = forecast_options(bundle, horizon, growth=growth, scenarios=n_scenarios)
+            st_echarts(options=options, height="480px")
+            st.caption(f"{n_scenarios:,} scenarios × {horizon} years; P5/P95 bands across scenarios.")
+        except Exception as e:
+            st.error(f"Forecast error: {e}")
+
 
 
 
@@ -0,0 +1,100 @@
+import atexit
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+
+import local_store
+import metrics
+
+# ----------------- CONFIG -----------------
+# Events are buffered in memory and written to the maize.db logs table in
+# one transaction every FLUSH_EVERY events or FLUSH_MS milliseconds.
+FLUSH_EVERY = int(os.environ.get("AGRIPRICE_LOG_FLUSH_EVERY", "100"))
+FLUSH_MS = int(os.environ.get("AGRIPRICE_LOG_FLUSH_MS", "1000"))
+MAX_BUFFER = 100_000
+
+
+class ActivityLogger:
+    def __init__(self, flush_every=FLUSH_EVERY, flush_ms=FLUSH_MS):
+        self.flush_every = flush_every
+        self.flush_ms = flush_ms
+        self.dropped = 0
+        self.flush_errors = 0
+        self.last_error = None
+        self._events = queue.Queue(maxsize=MAX_BUFFER)
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def log(self, email, action):
+        # Never blocks the rerun: if the buffer is full the event is dropped.
+        self._ensure_running()
+        stamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            self._events.put_nowait((email, action, stamp))
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self._events.qsize() >= self.flush_every:
+            self._wakeup.set()
+
+    def flush(self):
+        with self._flush_lock:
+            batch = []
+            while True:
+                try:
+                    batch.append(self._events.get_nowait())
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    with local_store.store().cursor() as cursor:
+                        cursor.executemany("INSERT INTO logs (email, action, timestamp) VALUES (%s, %s, %s)",
+                                           batch)
+                except Exception:
+                    # Kept for the next flush (e.g. maize.db locked by
+                    # another writer); whatever no longer fits is dropped.
+                    for event in batch:
+                        try:
+                            self._events.put_nowait(event)
+                        except queue.Full:
+                            self.dropped += 1
+                    raise
+            return len(batch)
+
+    def _ensure_running(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="agriprice-activity-log", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_ms / 1000)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                self.last_error = None
+            except Exception as e:
+                self.flush_errors += 1
+                if str(e) != self.last_error:
+                    # Once per distinct error, not every FLUSH_MS while it lasts
+                    print(f"Activity log flush failed, {self._events.qsize()} events kept for retry: {e}")
+                self.last_error = str(e)
+
+    def stats(self):
+        return {"activity_log_pending": self._events.qsize(), "activity_log_dropped": self.dropped,
+                "activity_log_flush_errors": self.flush_errors}
+
+
+logger = ActivityLogger()
+metrics.register_collector(logger.stats)
+
+
+def log_event(email, action):
+    logger.log(email, action)
@@ -0,0 +1,216 @@
+import os
+import random
+
+import streamlit as st
+
+import db
+from metrics import timed, timer
+from hashing import HashingBusy, hash_password, verify_password, needs_rehash
+import local_store
+import rate_limit
+
+# ----------------- USER STORE -----------------
+def users_db():
+    # MySQL when it is reachable, otherwise the local SQLite fallback.
+    return db.pool if db.connected() else local_store.store()
+
+def with_users_db(operation, busy=None):
+    # Runs operation(store); if MySQL drops mid-request it is marked down
+    # and the operation is retried once on the local store. When every pooled
+    # connection is taken the caller gets `busy` back instead of a failover.
+    users = users_db()
+    try:
+        with timer("auth_db_query"):
+            return operation(users)
+    except db.PoolExhausted:
+        st.warning("The server is busy. Please try again shortly.")
+        return busy
+    except Exception as e:
+        if users is not db.pool or not db.is_connection_error(users, e):
+            raise
+        db.mark_down(users)
+        return operation(local_store.store())
+
+SYNC_BATCH = 1000
+
+@timed("sync_to_mysql")
+def sync_to_mysql():
+    # Pushes local users to MySQL in one transaction. "synced_upto" is a
+    # high-water mark on the local users.id, so users that were already
+    # synced are never looked up again.
+    remote = db.pool
+    if remote is None:
+        return 0
+    local = local_store.store()
+    mark = int(local_store.get_meta(local, "synced_upto", 0))
+    with local.cursor() as cursor:
+        cursor.execute("SELECT id, email, password_hash, confirmation_code, confirmed FROM users "
+                       "WHERE id > %s ORDER BY id", (mark,))
+        rows = cursor.fetchall()
+    if not rows:
+        return 0
+
+    pending = {u["email"]: u for u in rows}
+    emails = list(pending)
+    try:
+        _insert_missing(remote, pending, emails)
+    except db.PoolExhausted:
+        return 0  # busy; the high-water mark is unchanged, so the next sync retries
+    except Exception as e:
+        if not db.is_connection_error(remote, e):
+            raise
+        db.mark_down(remote)
+        return 0
+
+    with local.cursor() as cursor:
+        local_store.set_meta(cursor, "synced_upto", rows[-1]["id"])
+    return len(pending)
+
+def _insert_missing(remote, pending, emails):
+    with remote.cursor() as cursor:
+        for i in range(0, len(emails), SYNC_BATCH):
+            chunk = emails[i:i + SYNC_BATCH]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(f"SELECT email FROM users WHERE email IN ({placeholders})", chunk)
+            for row in cursor.fetchall():
+                pending.pop(row["email"], None)
+        if pending:
+            cursor.executemany(
+                "INSERT INTO users (email, password_hash, confirmation_code, confirmed) VALUES (%s, %s, %s, %s)",
+                [(u["email"], u["password_hash"], u["confirmation_code"], bool(u["confirmed"]))
+                 for u in pending.values()]
+            )
+
+# ----------------- RATE LIMITING -----------------
+# Behind a reverse proxy every request comes from the proxy's address; set
+# this only when one trusted proxy appends the client to X-Forwarded-For.
+TRUSTED_PROXY = os.environ.get("AGRIPRICE_TRUSTED_PROXY", "0") == "1"
+
+def client_id():
+    # Best available per-client key, or None when the address is unknown
+    # (local runs): one bucket shared by every such client would let a single
+    # one lock everybody out, so those requests are limited per email only.
+    try:
+        if TRUSTED_PROXY:
+            forwarded = st.context.headers.get("X-Forwarded-For")
+            if forwarded:
+                # The proxy appends the address it saw; earlier entries are
+                # whatever the client sent.
+                return forwarded.split(",")[-1].strip() or None
+        return st.context.ip_address or None
+    except Exception:
+        return None
+
+def allowed(*buckets):
+    # Checked before any bcrypt or DB work; rejected requests cost a few
+    # microseconds and never reach the hashing pool. Buckets without a key
+    # are skipped, and a rejection gives back the tokens already taken.
+    taken = []
+    for scope, key in buckets:
+        if key is None:
+            continue
+        retry_after = rate_limit.acquire(scope, key)
+        if retry_after:
+            refund(*taken)
+            st.warning(f"Too many attempts. Try again in {retry_after:.0f} seconds.")
+            return False
+        taken.append((scope, key))
+    return True
+
+def refund(*buckets):
+    for scope, key in buckets:
+        if key is not None:
+            rate_limit.refund(scope, key)
+
+# ----------------- AUTH FUNCTIONS -----------------
+@timed("register_user")
+def register_user(email, password, client=None):
+    email_bucket = ("register_email", email.strip().lower())
+    if not allowed(("register_client", client or client_id()), email_bucket):
+        return False, None
+    if find_user(email):
+        # Turned away before hashing, so the email's own budget is not spent;
+        # the client token stays charged or Register would be a free way to
+        # probe which emails have accounts.
+        refund(email_bucket)
+        st.warning("Email already registered.")
+        return False, None
+    code = str(random.randint(100000, 999999))
+    try:
+        password_hash = hash_password(password)
+    except HashingBusy:
+        st.warning("The server is busy. Please try again shortly.")
+        return False, None
+    print(f"Code to be sent are: {code}")
+
+    def insert(users):
+        try:
+            with users.cursor() as cursor:
+                cursor.execute("INSERT INTO users (email, password_hash, confirmation_code) VALUES (%s, %s, %s)",
+                               (email, password_hash, code))
+            # send_confirmation_email(email, code)
+            return True, code
+        except users.errors.IntegrityError:
+            if users is db.pool:
+                st.warning("Email already registered.")
+            else:
+                st.warning("Email already registered locally.")
+            return False, None
+
+    return with_users_db(insert, busy=(False, None))
+
+def confirm_user(email, code):
+    def confirm(users):
+        with users.cursor() as cursor:
+            cursor.execute("SELECT * FROM users WHERE email = %s AND confirmation_code = %s", (email, code))
+            if cursor.fetchone():
+                cursor.execute("UPDATE users SET confirmed = TRUE WHERE email = %s", (email,))
+                return True
+        return False
+
+    return with_users_db(confirm, busy=False)
+
+def find_user(email):
+    def select(users):
+        with users.cursor() as cursor:
+            cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
+            return cursor.fetchone()
+
+    return with_users_db(select)
+
+@timed("authenticate_user")
+def authenticate_user(email, password, client=None):
+    if not allowed(("login_client", client or client_id()), ("login_email", email.strip().lower())):
+        return False
+    user = find_user(email)
+
+    try:
+        verified = bool(user) and verify_password(password, user["password_hash"])
+    except HashingBusy:
+        st.warning("The server is busy. Please try again shortly.")
+        return False
+    if verified:
+        if needs_rehash(user["password_hash"]):
+            # Cost factor changed since this hash was made
+            try:
+                update_user_password(email, password)
+            except HashingBusy:
+                pass  # the old hash still works; retried on the next login
+        if user.get("confirmed"):
+            return True
+        else:
+            st.warning("Account not confirmed. Check your email.")
+    return False
+
+def update_user_password(email, new_password):
+    hashed = hash_password(new_password)
+
+    def update(users):
+        with users.cursor() as cursor:
+            cursor.execute("UPDATE users SET password_hash=%s WHERE email=%s", (hashed, email))
+        return True
+
+    return with_users_db(update, busy=False)
+
+# Push users registered locally during an outage once MySQL is back
+db.on_reconnect(sync_to_mysql)
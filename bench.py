@@ -0,0 +1,245 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import socketserver
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import bcrypt
+import numpy as np
+import pandas as pd
+
+import auth
+import db
+import hashing
+import local_store
+import mailer
+import prediction
+import rate_limit
+from historical import FEATURES, chart_options, yearly_averages
+from model_registry import ModelRegistry
+
+# Reproducible benchmarks for the auth, mail, prediction and Historical Data
+# paths, run against local stand-ins (SQLite for MySQL, an in-process SMTP
+# sink). Results are printed as JSON so runs can be diffed over time.
+HERE = os.path.dirname(os.path.abspath(__file__))
+SEED = 0
+
+
+def percentiles(samples):
+    values = np.asarray(samples) * 1000
+    return {"p50_ms": float(np.percentile(values, 50)), "p95_ms": float(np.percentile(values, 95)),
+            "max_ms": float(values.max()), "n": len(values)}
+
+
+def timed_calls(fn, args_list):
+    samples = []
+    for args in args_list:
+        started = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+# ----------------- STAND-INS -----------------
+class SMTPSink(socketserver.ThreadingTCPServer):
+    # Minimal SMTP server that accepts and counts every message.
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.received = 0
+        self.lock = threading.Lock()
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 bench ESMTP")
+        in_data = False
+        for raw in self.rfile:
+            line = raw.decode(errors="replace").rstrip("\r\n")
+            if in_data:
+                if line == ".":
+                    in_data = False
+                    with self.server.lock:
+                        self.server.received += 1
+                    self.reply("250 OK")
+                continue
+            command = line[:4].upper()
+            if command == "EHLO":
+                self.reply("250-bench")
+                self.reply("250 OK")
+            elif command == "DATA":
+                in_data = True
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+def mysql_stand_in(path):
+    conn = db.sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY AUTOINCREMENT, email TEXT UNIQUE, "
+                 "password_hash TEXT NOT NULL, confirmed BOOLEAN NOT NULL DEFAULT 0, confirmation_code TEXT)")
+    conn.commit()
+    conn.close()
+    return db.sqlite_pool(path)
+
+
+def write_synthetic_users(path, count, password_hash):
+    users = [{"email": f"user{i}@bench.local", "password_hash": password_hash,
+              "confirmation_code": "000000", "confirmed": True} for i in range(count)]
+    with open(path, "w") as f:
+        json.dump({"users": users}, f)
+
+
+# ----------------- BENCHMARKS -----------------
+def bench_auth_and_sync(sizes, ops, workdir):
+    password_hash = bcrypt.hashpw(b"bench-password", bcrypt.gensalt(hashing.BCRYPT_ROUNDS)).decode()
+    results = []
+    for count in sizes:
+        size_dir = tempfile.mkdtemp(prefix=f"users{count}-", dir=workdir)
+        local_store.LOCAL_DB = os.path.join(size_dir, "maize.db")
+        local_store.LEGACY_DATA_FILE = os.path.join(size_dir, "data.json")
+        write_synthetic_users(local_store.LEGACY_DATA_FILE, count, password_hash)
+        db.mark_down()
+
+        started = time.perf_counter()
+        local_store.store()
+        migrate_seconds = time.perf_counter() - started
+
+        rng = np.random.default_rng(SEED)
+        existing = [(f"user{i}@bench.local", "bench-password") for i in rng.integers(0, count, ops)]
+        fresh = [(f"new{i}@bench.local", "bench-password") for i in range(ops)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            register = timed_calls(auth.register_user, fresh)
+        authenticate = timed_calls(auth.authenticate_user, existing)
+
+        db.use_pool(lambda: mysql_stand_in(os.path.join(size_dir, "mysql.db")))
+        started = time.perf_counter()
+        synced = auth.sync_to_mysql()
+        full_sync = time.perf_counter() - started
+        started = time.perf_counter()
+        auth.sync_to_mysql()
+        incremental_sync = time.perf_counter() - started
+        db.mark_down()
+
+        results.append({
+            "users": count,
+            "migrate_json_seconds": migrate_seconds,
+            "register_user": percentiles(register),
+            "authenticate_user": percentiles(authenticate),
+            "sync_to_mysql": {"synced": synced, "full_seconds": full_sync, "incremental_seconds": incremental_sync},
+        })
+    return {"bcrypt_rounds": hashing.BCRYPT_ROUNDS, "sizes": results}
+
+
+def bench_mail(messages):
+    sink = SMTPSink()
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+    mailer.SMTP_HOST, mailer.SMTP_PORT = sink.server_address
+    mailer.SMTP_SSL = False
+    mailer.EMAIL_ADDRESS = mailer.EMAIL_ADDRESS or "bench@agriprice.local"
+    mailer.EMAIL_PASSWORD = ""
+
+    started = time.perf_counter()
+    samples = []
+    for i in range(messages):
+        call_started = time.perf_counter()
+        mail_id = mailer.send_confirmation_email(f"user{i}@bench.local", "123456")
+        samples.append(time.perf_counter() - call_started)
+    while sink.received < messages and time.perf_counter() - started < 60:
+        time.sleep(0.01)
+    drained = time.perf_counter() - started
+    status = mailer.send_status(mail_id)
+    sink.shutdown()
+    return {"messages": messages, "enqueue": percentiles(samples), "drain_seconds": drained,
+            "delivered": sink.received, "last_status": status["status"] if status else None}
+
+
+def scaled_history(data, factor, rng):
+    # maize_data.csv repeated `factor` times with multiplicative noise.
+    frame = pd.concat([data] * factor, ignore_index=True)
+    noise = rng.normal(1.0, 0.05, size=(len(frame), len(FEATURES)))
+    frame[FEATURES] = frame[FEATURES].to_numpy(dtype=float) * noise
+    return frame
+
+
+def bench_historical(bundle, factors):
+    rng = np.random.default_rng(SEED)
+    data = pd.read_csv(os.path.join(HERE, "maize_data.csv"))
+    results = []
+    for factor in factors:
+        frame = scaled_history(data, factor, rng)
+        started = time.perf_counter()
+        yearly_avg = yearly_averages(bundle["model"], frame)
+        aggregate = time.perf_counter() - started
+        started = time.perf_counter()
+        payload = json.dumps({feature: chart_options(yearly_avg, feature) for feature in FEATURES})
+        serialize = time.perf_counter() - started
+        results.append({"rows": len(frame), "groupby_seconds": aggregate, "payload_seconds": serialize,
+                        "payload_bytes": len(payload)})
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AgriPrice benchmark suite (JSON output).")
+    parser.add_argument("--users", default="1000,10000,100000",
+                        help="comma-separated synthetic user counts (up to 1000000)")
+    parser.add_argument("--auth-ops", type=int, default=20, help="register/login calls timed per size")
+    parser.add_argument("--bcrypt-rounds", type=int, default=hashing.BCRYPT_ROUNDS)
+    parser.add_argument("--mail", type=int, default=200, help="messages pushed through the SMTP sink")
+    parser.add_argument("--history-factors", default="1,10,100,1000",
+                        help="how many times maize_data.csv is replicated for the groupby benchmark")
+    parser.add_argument("--predict-rows", default="1,1000,100000,1000000")
+    parser.add_argument("--out", help="also write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    hashing.BCRYPT_ROUNDS = args.bcrypt_rounds
+    rate_limit.ENABLED = False  # every synthetic call comes from one client
+    bundle = ModelRegistry(os.path.join(HERE, "model.pkl")).get()
+    bundle["data"]  # load split-artifact data up front so it is not timed
+    with tempfile.TemporaryDirectory(prefix="agriprice-bench-") as workdir:
+        results = {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "git": git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "model_version": bundle["version"],
+            },
+            "auth": bench_auth_and_sync([int(n) for n in args.users.split(",")], args.auth_ops, workdir),
+            "mail": bench_mail(args.mail),
+            "predict": prediction.benchmark(bundle["model"], [int(n) for n in args.predict_rows.split(",")]),
+            "historical": bench_historical(bundle, [int(n) for n in args.history_factors.split(",")]),
+        }
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Cold start = a fresh interpreter rendering the first (login) page of
+# Home.py headlessly. Exits non-zero when the median goes over budget or a
+# module that should load lazily shows up on that path.
+BUDGET_SECONDS = float(os.environ.get("AGRIPRICE_STARTUP_BUDGET", "2.0"))
+# mysql.connector is left out on purpose: it is imported by the background
+# connect thread, off the page's critical path.
+LAZY_MODULES = ["matplotlib", "seaborn", "sklearn", "streamlit_echarts", "smtplib"]
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+app = AppTest.from_file("Home.py", default_timeout=60).run()
+finished = time.perf_counter()
+print(json.dumps({
+    "streamlit_import": imported - started,
+    "first_page": finished - imported,
+    "total": finished - started,
+    "errors": [str(e.value) for e in app.exception],
+    "loaded": [m for m in %r if m in sys.modules],
+}))
+"""
+
+
+def measure(runs=5):
+    here = os.path.dirname(os.path.abspath(__file__))
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-W", "ignore", "-c", PROBE % (LAZY_MODULES,)],
+                             cwd=here, capture_output=True, text=True, check=True)
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {
+        "runs": runs,
+        "median_total": statistics.median(s["total"] for s in samples),
+        "median_first_page": statistics.median(s["first_page"] for s in samples),
+        "budget": BUDGET_SECONDS,
+        "errors": sorted({e for s in samples for e in s["errors"]}),
+        "eager_modules": sorted({m for s in samples for m in s["loaded"]}),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold-start benchmark for Home.py.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=BUDGET_SECONDS, help="max median seconds")
+    args = parser.parse_args(argv)
+
+    result = measure(args.runs)
+    result["budget"] = args.budget
+    print(json.dumps(result, indent=2))
+    if result["errors"] or result["eager_modules"] or result["median_total"] > args.budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
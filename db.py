@@ -0,0 +1,288 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# ----------------- CONFIG -----------------
+DB_CONFIG = {
+    "host": "localhost",
+    "user": "root",
+    "password": "king",
+    "database": "agri_users",
+    "connection_timeout": 3,
+}
+POOL_SIZE = 8
+POOL_TIMEOUT = 5
+# Connects made while serving a request (replacing a dead idle connection,
+# growing the pool) give up sooner than the health monitor's.
+REQUEST_CONNECT_TIMEOUT = 1
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class Cursor:
+    # Thin DB-API cursor wrapper so the same "%s" queries run on MySQL and on
+    # a SQLite stand-in.
+
+    def __init__(self, cursor, placeholder):
+        self._cursor = cursor
+        self._placeholder = placeholder
+
+    def _sql(self, query):
+        if self._placeholder == "%s":
+            return query
+        return query.replace("%s", self._placeholder)
+
+    def execute(self, query, params=()):
+        self._cursor.execute(self._sql(query), params)
+        return self
+
+    def executemany(self, query, rows):
+        self._cursor.executemany(self._sql(query), rows)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+
+class ConnectionPool:
+    # Bounded pool: at most `size` connections exist at once, idle ones are
+    # health-checked before reuse and broken ones are replaced transparently.
+    # `request_connect` (default `connect`) opens connections for requests;
+    # check() uses `connect`.
+
+    def __init__(self, connect, size=POOL_SIZE, timeout=POOL_TIMEOUT, placeholder="%s",
+                 cursor_kwargs=None, errors=None, ping=None, request_connect=None):
+        self._connect = connect
+        self._request_connect = request_connect or connect
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self.size = size
+        self.timeout = timeout
+        self.placeholder = placeholder
+        self.cursor_kwargs = cursor_kwargs or {}
+        self.errors = errors
+        self._ping = ping or _select_one
+
+    def _checkout(self, connect):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return connect()
+            if self._healthy(conn):
+                return conn
+            _close(conn)
+
+    def _healthy(self, conn):
+        try:
+            self._ping(conn)
+            return True
+        except Exception:
+            return False
+
+    @contextmanager
+    def connection(self, connect=None):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolExhausted(f"no database connection free after {self.timeout}s")
+        conn = None
+        try:
+            conn = self._checkout(connect or self._request_connect)
+            yield conn
+        except Exception:
+            if conn is not None:
+                try:
+                    conn.rollback()
+                except Exception:
+                    _close(conn)
+                    conn = None
+            raise
+        finally:
+            if conn is not None:
+                self._idle.put(conn)
+            self._slots.release()
+
+    def check(self):
+        # One checkout with the full connect timeout, for the health monitor.
+        with self.connection(self._connect):
+            pass
+
+    @contextmanager
+    def cursor(self):
+        # One connection and cursor per call; committed on success.
+        with self.connection() as conn:
+            raw = conn.cursor(**self.cursor_kwargs)
+            try:
+                yield Cursor(raw, self.placeholder)
+                conn.commit()
+            finally:
+                raw.close()
+
+    def close(self):
+        while True:
+            try:
+                _close(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+def _select_one(conn):
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT 1")
+        cur.fetchall()
+    finally:
+        cur.close()
+
+
+def _close(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def _dict_row(cursor, row):
+    return {col[0]: value for col, value in zip(cursor.description, row)}
+
+
+def mysql_pool(size=POOL_SIZE, **overrides):
+    import mysql.connector
+
+    config = dict(DB_CONFIG, **overrides)
+    request_config = dict(config, connection_timeout=REQUEST_CONNECT_TIMEOUT)
+    return ConnectionPool(
+        lambda: mysql.connector.connect(**config),
+        request_connect=lambda: mysql.connector.connect(**request_config),
+        size=size,
+        cursor_kwargs={"dictionary": True},
+        errors=mysql.connector.errors,
+        ping=lambda conn: conn.ping(reconnect=False),
+    )
+
+
+def sqlite_pool(path, size=POOL_SIZE):
+    # Local stand-in for MySQL with the same dict rows and error classes.
+    def connect():
+        conn = sqlite3.connect(path, timeout=POOL_TIMEOUT, check_same_thread=False)
+        conn.row_factory = _dict_row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    return ConnectionPool(connect, size=size, placeholder="?", errors=sqlite3)
+
+
+# ----------------- PROCESS-WIDE POOL -----------------
+# `pool` is None while MySQL is unreachable. Only the HealthMonitor thread
+# waits on the full connect timeout; request paths read the flag and bound
+# their own reconnects by REQUEST_CONNECT_TIMEOUT.
+HEALTH_INTERVAL = float(os.environ.get("AGRIPRICE_DB_HEALTH_INTERVAL", "5"))
+
+pool = None
+_init_lock = threading.Lock()
+_ready = threading.Event()
+_monitor = None
+_listeners = []
+
+
+class HealthMonitor(threading.Thread):
+    def __init__(self, factory, interval=HEALTH_INTERVAL):
+        super().__init__(name="agriprice-db-health", daemon=True)
+        self.factory = factory
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def check(self):
+        current = pool
+        if current is None:
+            if use_pool(self.factory) is not None:
+                for callback in _listeners:
+                    try:
+                        callback()
+                    except Exception:
+                        pass
+        else:
+            try:
+                # Checkout pings an idle connection and replaces it if broken
+                current.check()
+            except PoolExhausted:
+                pass  # every connection is in use: MySQL is up, just busy
+            except Exception as e:
+                if is_connection_error(current, e):
+                    mark_down(current)
+        _ready.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.check()
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def init_pool(factory=mysql_pool, wait=True):
+    # Starts the health monitor once per process. Its first check opens the
+    # pool; with wait=False callers use the local store until that is done.
+    global _monitor
+    with _init_lock:
+        if _monitor is None:
+            _monitor = HealthMonitor(factory)
+            _monitor.start()
+    if wait:
+        _ready.wait()
+    return pool is not None
+
+
+def ready():
+    return _ready.is_set()
+
+
+def on_reconnect(callback):
+    # Called from the monitor thread whenever MySQL comes (back) up.
+    _listeners.append(callback)
+
+
+def use_pool(factory):
+    global pool
+    try:
+        candidate = factory()
+        candidate.check()
+    except Exception:
+        candidate = None
+    pool = candidate
+    return candidate
+
+
+def mark_down(failed=None):
+    # Fail over to the local store; the monitor reconnects in the background.
+    global pool
+    current = pool
+    if current is not None and (failed is None or failed is current):
+        pool = None
+        current.close()
+
+
+def is_connection_error(pool_, error):
+    # Only a lost server counts. PoolExhausted means MySQL is up but busy;
+    # failing over then would send logins to a store without its users.
+    errors = pool_.errors
+    return errors is not None and isinstance(error, (errors.OperationalError, errors.InterfaceError))
+
+
+def connected():
+    return pool is not None
@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+import metrics
+
+# ----------------- CONFIG -----------------
+# bcrypt releases the GIL, so a thread pool gives real parallelism while
+# capping how many cores hashing can take from the rest of the app.
+BCRYPT_ROUNDS = int(os.environ.get("AGRIPRICE_BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.environ.get("AGRIPRICE_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# Global cap on queued + running hashes; past it requests are shed at once
+# instead of waiting behind a burst.
+MAX_PENDING = int(os.environ.get("AGRIPRICE_HASH_MAX_PENDING", str(HASH_WORKERS * 8)))
+
+_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="agriprice-bcrypt")
+_lock = threading.Lock()
+_stats = {"queued": 0, "running": 0, "hash_count": 0, "check_count": 0, "hash_seconds": 0.0, "check_seconds": 0.0,
+          "wait_seconds": 0.0, "shed": 0}
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def _run(kind, fn, *args):
+    submitted = time.perf_counter()
+    with _lock:
+        if _stats["queued"] + _stats["running"] >= MAX_PENDING:
+            _stats["shed"] += 1
+            raise HashingBusy(f"{MAX_PENDING} password hashes already pending")
+        _stats["queued"] += 1
+
+    def job():
+        started = time.perf_counter()
+        with _lock:
+            _stats["queued"] -= 1
+            _stats["running"] += 1
+            _stats["wait_seconds"] += started - submitted
+        try:
+            with metrics.timer("bcrypt_" + kind):
+                return fn(*args)
+        finally:
+            with _lock:
+                _stats["running"] -= 1
+                _stats[kind + "_count"] += 1
+                _stats[kind + "_seconds"] += time.perf_counter() - started
+
+    return _executor.submit(job).result()
+
+
+def stats():
+    # Counters for sizing HASH_WORKERS: queue depth, in-flight jobs and
+    # cumulative latency per operation.
+    with _lock:
+        return dict(_stats)
+
+
+metrics.register_collector(lambda: {"bcrypt_" + key: value for key, value in stats().items()})
+
+
+def hash_password(password, rounds=None):
+    salt = bcrypt.gensalt(rounds or BCRYPT_ROUNDS)
+    return _run("hash", bcrypt.hashpw, password.encode(), salt).decode()
+
+
+def _checkpw(password, password_hash):
+    try:
+        return bcrypt.checkpw(password, password_hash)
+    except ValueError:
+        # Not a bcrypt hash (e.g. legacy rows in maize.db)
+        return False
+
+
+def verify_password(password, password_hash):
+    return _run("check", _checkpw, password.encode(), password_hash.encode())
+
+
+def hash_rounds(password_hash):
+    try:
+        return int(password_hash.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def needs_rehash(password_hash):
+    return hash_rounds(password_hash) != BCRYPT_ROUNDS
@@ -0,0 +1,171 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from metrics import timer
+from prediction import PredictionCache, model_features, predict_matrix
+
+# Features of the maize_data.csv layout; bundles carry their own (per-region
+# models call population "Population"), see history_features().
+FEATURES = ["Rainfall_mm", "Total_Production_MT", "Mbeya_Population"]
+TARGET = "Cost_Tsh_per_kg"
+YEAR_COL = "Year"
+FORECAST_PERCENTILES = (5, 50, 95)
+CACHED_VERSIONS = 8
+FORECAST_CACHE_SIZE = 64
+
+_lock = threading.Lock()
+_charts = {}
+
+
+def history_features(model):
+    return [col for col in model_features(model) if col != YEAR_COL]
+
+
+def yearly_averages(model, data, features=FEATURES):
+    # Compute yearly averages
+    yearly_avg = data.groupby(YEAR_COL).mean(numeric_only=True).reset_index()
+
+    # Predict next year price using the average of last year features
+    next_year = yearly_avg[YEAR_COL].max() + 1
+    last_row = yearly_avg[yearly_avg[YEAR_COL] == yearly_avg[YEAR_COL].max()]
+    next_features = np.array([[next_year, *(last_row[feature].values[0] for feature in features)]], dtype=float)
+    predicted_next_price = predict_matrix(model, next_features)[0]
+
+    # Append predicted row
+    predicted_row = pd.DataFrame({
+        YEAR_COL: [next_year],
+        **{feature: last_row[feature].values for feature in features},
+        TARGET: [predicted_next_price]
+    })
+    return pd.concat([yearly_avg, predicted_row], ignore_index=True)
+
+
+def chart_options(yearly_avg, feature):
+    return {
+        "tooltip": {"trigger": "axis"},
+        "legend": {"data": [feature, "Price (Tsh/kg)"]},
+        "xAxis": {"type": "category", "data": yearly_avg[YEAR_COL].tolist()},
+        "yAxis": [
+            {"type": "value", "name": feature},
+            {"type": "value", "name": "Price (Tsh/kg)"}
+        ],
+        "series": [
+            {
+                "name": feature,
+                "type": "line",
+                "data": yearly_avg[feature].round(2).tolist(),
+            },
+            {
+                "name": "Price (Tsh/kg)",
+                "type": "line",
+                "yAxisIndex": 1,
+                "data": yearly_avg[TARGET].round(2).tolist(),
+            },
+        ],
+    }
+
+
+def historical_charts(bundle):
+    # ECharts payloads for every feature, built once per model/data version.
+    # A few versions are kept so switching between regions stays cached.
+    version = bundle["version"]
+    charts = _charts.get(version)
+    if charts is not None:
+        return charts
+    with _lock:
+        if version not in _charts:
+            features = history_features(bundle["model"])
+            with timer("historical_aggregate"):
+                yearly_avg = yearly_averages(bundle["model"], bundle["data"], features)
+            with timer("echarts_payload"):
+                charts = {feature: chart_options(yearly_avg, feature) for feature in features}
+            while len(_charts) >= CACHED_VERSIONS:
+                _charts.pop(next(iter(_charts)))
+            _charts[version] = charts
+        return _charts[version]
+
+
+# ----------------- FORECAST -----------------
+def trend(by_year):
+    # Least-squares line through each feature's yearly means. Returns the
+    # yearly growth relative to the last year's level and the relative
+    # scatter of the yearly means around the line (the scenario spread).
+    years = by_year.index.to_numpy(dtype=float)
+    values = by_year.to_numpy(dtype=float)
+    slope, intercept = np.polyfit(years, values, 1)
+    fitted = np.outer(years, slope) + intercept
+    return slope / values[-1], ((values - fitted) / fitted).std(axis=0)
+
+
+def forecast_trajectories(model, data, horizon, growth=None, scenarios=1, spread=None, seed=0):
+    # Projects rainfall/production/population `horizon` years past the last
+    # observed year and prices every (scenario, year) pair in one predict.
+    # Features compound the yearly growth rates (the trend when `growth` is
+    # None) and each scenario-year gets an independent relative shock with
+    # std `spread` (per feature; None = historical scatter around the trend,
+    # 0 = one deterministic path). Returns (years, prices) with prices shaped
+    # (scenarios, horizon).
+    features = history_features(model)
+    by_year = data.groupby(YEAR_COL)[features].mean()
+    last_year = int(by_year.index.max())
+    base = by_year.loc[last_year].to_numpy(dtype=float)
+    trend_rates, scatter = trend(by_year)
+    growth = trend_rates if growth is None else np.asarray(growth, dtype=float)
+    spread = scatter if spread is None else np.asarray(spread, dtype=float)
+
+    levels = base * np.cumprod(np.broadcast_to(1.0 + growth, (horizon, len(features))), axis=0)
+    shocks = np.random.default_rng(seed).normal(0.0, 1.0, size=(scenarios, horizon, len(features)))
+    paths = levels * np.maximum(1.0 + shocks * spread, 0.0)
+
+    years = last_year + 1 + np.arange(horizon)
+    matrix = np.empty((scenarios, horizon, len(features) + 1))
+    matrix[..., 0] = years
+    matrix[..., 1:] = paths
+    prices = predict_matrix(model, matrix.reshape(-1, matrix.shape[-1]))
+    return years, prices.reshape(scenarios, horizon)
+
+
+def forecast_chart(data, years, prices, percentiles=FORECAST_PERCENTILES):
+    # Observed yearly price followed by percentile bands across scenarios.
+    history = data.groupby(YEAR_COL)[TARGET].mean()
+    bands = np.percentile(prices, percentiles, axis=0)
+    gap = [None] * len(years)
+    names = [f"P{p}" for p in percentiles]
+    series = [{"name": "Observed", "type": "line", "data": history.round(2).tolist() + gap}]
+    for name, band in zip(names, bands):
+        series.append({
+            "name": name,
+            "type": "line",
+            "lineStyle": {"type": "solid" if name == "P50" else "dashed"},
+            "data": [None] * (len(history) - 1) + [round(float(history.iloc[-1]), 2)] + band.round(2).tolist(),
+        })
+    return {
+        "tooltip": {"trigger": "axis"},
+        "legend": {"data": ["Observed"] + names},
+        "xAxis": {"type": "category", "data": history.index.tolist() + years.tolist()},
+        "yAxis": {"type": "value", "name": "Price (Tsh/kg)"},
+        "series": series,
+    }
+
+
+forecast_cache = PredictionCache(size=FORECAST_CACHE_SIZE)
+metrics.register_collector(lambda: {"forecast_cache_" + key: value
+                                    for key, value in forecast_cache.stats().items()})
+
+
+def forecast_options(bundle, horizon, growth=None, scenarios=1):
+    # forecast_chart payload for one set of page inputs. Trajectories use the
+    # fixed default seed, so the same inputs always give the same chart and
+    # page reruns serve it from the cache instead of re-simulating.
+    key = (bundle["version"], int(horizon), int(scenarios),
+           None if growth is None else tuple(float(rate) for rate in growth))
+    options = forecast_cache.get(key)
+    if options is None:
+        years, prices = forecast_trajectories(bundle["model"], bundle["data"], horizon,
+                                              growth=growth, scenarios=scenarios)
+        options = forecast_chart(bundle["data"], years, prices)
+        forecast_cache.put(key, options)
+    return options
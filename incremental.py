@@ -0,0 +1,232 @@
+import argparse
+import fcntl
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LinearRegression, Ridge
+
+from model_registry import MODEL_FILE, Bundle
+from prediction import TARGET, model_features
+from train import _atomic_write, iqr_bounds, iqr_mask, save_bundle
+
+# New market prices are folded into the published model without re-reading
+# the history: a linear model only needs the row count, the feature/target
+# means and the triangular factor R of the centered [X y] matrix (RᵀR is the
+# centered XᵀX/Xᵀy/yᵀy). Batches are merged with Chan's pairwise update and
+# re-triangularised with a QR, so no cross-product matrix is ever formed:
+# XᵀX squares the condition number, and with Population tracking Year almost
+# linearly that is enough to turn a near-null direction into noise.
+LINEAR_MODELS = (LinearRegression, Ridge)
+
+
+class SufficientStats:
+    def __init__(self, n_features):
+        self.n = 0
+        self.mean_x = np.zeros(n_features)
+        self.mean_y = 0.0
+        self.r = np.zeros((n_features + 1, n_features + 1))
+
+    @classmethod
+    def from_dict(cls, values):
+        stats = cls(len(values["mean_x"]))
+        stats.n = int(values["n"])
+        stats.mean_x = np.asarray(values["mean_x"], dtype=float)
+        stats.mean_y = float(values["mean_y"])
+        stats.r = np.asarray(values["r"], dtype=float)
+        return stats
+
+    def as_dict(self):
+        return {"n": self.n, "mean_x": self.mean_x, "mean_y": self.mean_y, "r": self.r}
+
+    def update(self, X, y):
+        # O(batch × features²); the history is never touched.
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float)
+        m = len(y)
+        if not m:
+            return self
+        batch_mean_x = X.mean(axis=0)
+        batch_mean_y = y.mean()
+        total = self.n + m
+        dx = batch_mean_x - self.mean_x
+        dy = batch_mean_y - self.mean_y
+        weight = self.n * m / total
+        rows = np.vstack([self.r, np.column_stack([X - batch_mean_x, y - batch_mean_y]),
+                          np.sqrt(weight) * np.append(dx, dy)])
+        self.r = np.linalg.qr(rows, mode="r")
+        self.mean_x += dx * m / total
+        self.mean_y += dy * m / total
+        self.n = total
+        return self
+
+    def solve(self, alpha=0.0, rcond=None):
+        # R has the singular values of the centered X, so this is the
+        # least-squares problem LinearRegression hands to lstsq, with the same
+        # cutoff (`rcond`, its `tol`) for dropping near-collinear directions.
+        # Ridge (alpha > 0) appends √alpha·I rows, i.e. (XᵀX + alpha·I)w = Xᵀy.
+        r_xx, z = self.r[:-1, :-1], self.r[:-1, -1]
+        if alpha:
+            r_xx = np.vstack([r_xx, np.sqrt(alpha) * np.eye(len(z))])
+            z = np.append(z, np.zeros(len(z)))
+        coef = np.linalg.lstsq(r_xx, z, rcond=rcond)[0]
+        return coef, self.mean_y - self.mean_x @ coef
+
+    def scores(self, coef):
+        # In-sample fit over every row seen so far, from the stats alone.
+        residual = self.r[:-1, :-1] @ coef - self.r[:-1, -1]
+        rss = residual @ residual + self.r[-1, -1] ** 2
+        syy = self.r[:, -1] @ self.r[:, -1]
+        return {"mse": float(rss / self.n), "r2": float(1 - rss / syy) if syy else 0.0}
+
+
+def fitted_model(template, stats, feature_names):
+    # A fitted estimator of the same kind as the published one, so
+    # predict_matrix and everything downstream see no difference. Built fresh
+    # rather than copied: bundles pickled by older scikit-learn lack newer
+    # parameters.
+    if isinstance(template, Ridge):
+        model = Ridge(alpha=template.alpha)
+        coef, intercept = stats.solve(template.alpha)
+    else:
+        model = LinearRegression()
+        coef, intercept = stats.solve(rcond=getattr(model, "tol", None))
+    model.coef_ = coef
+    model.intercept_ = float(intercept)
+    model.n_features_in_ = len(feature_names)
+    model.feature_names_in_ = np.asarray(feature_names, dtype=object)
+    return model
+
+
+@contextmanager
+def bundle_lock(path):
+    # Exclusive for the whole load → publish: two updates reading the same
+    # bundle would each write stats and data_appends without the other's
+    # batch. Readers don't take it; they only ever see a published model.pkl.
+    with open(f"{path}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def update_bundle(rows, path=MODEL_FILE):
+    # Folds `rows` into the bundle at `path` and publishes the new version:
+    # the batch is written as its own .npy, then model.pkl is atomically
+    # replaced, so ModelRegistry in every running worker hot-reloads it.
+    with bundle_lock(path):
+        return _update_bundle(rows, path)
+
+
+def _update_bundle(rows, path):
+    started = time.perf_counter()
+    bundle = Bundle(joblib.load(path), path)
+    template = bundle["model"]
+    if not isinstance(template, LINEAR_MODELS):
+        raise ValueError(f"Incremental updates need a linear model, not {type(template).__name__}; "
+                         "retrain with train.py --candidates linear,ridge_1,ridge_10")
+    features = model_features(template)
+    batch = rows[features + [TARGET]].dropna()
+    # Same IQR limits train.py applied to the training data, so one mistyped
+    # price can't move the published model. Bundles trained before the limits
+    # were stored take them from their (already filtered) history once.
+    bounds = (bundle.get("metadata") or {}).get("outlier_bounds") or iqr_bounds(bundle["data"])
+    kept = iqr_mask(batch, bounds=bounds)
+    rejected = int((~kept).sum())
+    batch = batch[kept]
+
+    if "data_file" not in bundle:
+        # Legacy all-in-one bundle: split it once so later updates only ever
+        # write the new rows.
+        save_bundle(bundle, path)
+        bundle = Bundle(joblib.load(path), path)
+
+    if "r" in bundle.get("stats", {}):
+        stats = SufficientStats.from_dict(bundle["stats"])
+    else:
+        # First update of a bundle from train.py (or one whose stats predate
+        # the QR form): one pass over the history.
+        history = bundle["data"]
+        stats = SufficientStats(len(features)).update(history[features], history[TARGET])
+    stats.update(batch[features], batch[TARGET])
+
+    root, _ = os.path.splitext(path)
+    append_path = f"{root}.data.{uuid.uuid4().hex[:12]}.npy"
+
+    def write_npy(tmp_path):
+        with open(tmp_path, "wb") as f:
+            np.save(f, batch.to_records(index=False))
+
+    _atomic_write(append_path, write_npy)
+
+    model = fitted_model(template, stats, features)
+    # The held-out scores and conformal interval describe the model train.py
+    # fitted on its split, not this one; without them the page shows the
+    # in-sample fit and interval_offsets recomputes the interval from the data.
+    metadata = {key: value for key, value in (bundle.get("metadata") or {}).items()
+                if key not in ("metrics", "cv_scores", "interval")}
+    metadata.update({
+        "updated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "rows_used": stats.n,
+        "rows_added": int(len(batch)),
+        "rows_rejected": rejected,
+        "outlier_bounds": bounds,
+        "estimator": type(model).__name__,
+        "in_sample": stats.scores(model.coef_),
+    })
+    published = {key: value for key, value in bundle.items() if key not in ("data", "version", "interval")}
+    published.update({
+        "model": model,
+        "stats": stats.as_dict(),
+        "data_appends": [*bundle.get("data_appends", ()), os.path.basename(append_path)],
+        "metadata": metadata,
+    })
+    _atomic_write(path, lambda tmp_path: joblib.dump(published, tmp_path))
+    metadata["update_seconds"] = time.perf_counter() - started
+    return metadata
+
+
+def compact(path=MODEL_FILE):
+    # Merges the appended batches back into one model.data.npy.
+    with bundle_lock(path):
+        return _compact(path)
+
+
+def _compact(path):
+    bundle = Bundle(joblib.load(path), path)
+    appends = list(bundle.get("data_appends", ()))
+    if not appends:
+        return 0
+    published = {key: value for key, value in bundle.items() if key not in ("data_appends", "version")}
+    published["data"] = bundle["data"]
+    save_bundle(published, path)
+    directory = os.path.dirname(os.path.abspath(path))
+    for name in appends:
+        os.unlink(os.path.join(directory, name))
+    return len(appends)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fold new market prices into a published model bundle.")
+    parser.add_argument("rows", nargs="?", help="CSV of new rows (model features + Cost_Tsh_per_kg)")
+    parser.add_argument("--model", default=MODEL_FILE, help="bundle to update (model.pkl or models/<crop>/<region>/model.pkl)")
+    parser.add_argument("--compact", action="store_true", help="merge appended batches into one data file")
+    args = parser.parse_args(argv)
+
+    result = {}
+    if args.rows:
+        result = update_bundle(pd.read_csv(args.rows), args.model)
+    if args.compact:
+        result["compacted_batches"] = compact(args.model)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
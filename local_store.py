@@ -0,0 +1,127 @@
+import json
+import os
+import threading
+
+import db
+
+# ----------------- LOCAL SQLITE STORE -----------------
+# Offline fallback for when MySQL is down: maize.db in WAL mode with a unique
+# index on users.email, so every auth query is a single indexed lookup.
+LOCAL_DB = "maize.db"
+LEGACY_DATA_FILE = "data.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT ,
+    password_hash TEXT NOT NULL,
+    confirmed BOOLEAN NOT NULL DEFAULT 0,
+    confirmation_code TEXT
+);
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT,
+    action TEXT NOT NULL,
+    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY(email) REFERENCES users(email)
+);
+CREATE TABLE IF NOT EXISTS mail_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recipient TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created DATETIME DEFAULT CURRENT_TIMESTAMP,
+    claimed_by TEXT,
+    claimed_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_mail_outbox_due ON mail_outbox(status, next_attempt);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS rate_limits (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_rate_limits_updated ON rate_limits(updated);
+"""
+
+_lock = threading.Lock()
+_stores = {}
+
+
+def store(path=None):
+    path = path or LOCAL_DB
+    with _lock:
+        pool = _stores.get(path)
+        if pool is None:
+            pool = db.sqlite_pool(path)
+            with pool.connection() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(SCHEMA)
+                _add_columns(conn, "mail_outbox", {"claimed_by": "TEXT", "claimed_at": "REAL"})
+                conn.commit()
+            dedupe_users(pool)
+            migrate_json(pool)
+            _stores[path] = pool
+        return pool
+
+
+def _add_columns(conn, table, columns):
+    # CREATE TABLE IF NOT EXISTS leaves older maize.db files without columns
+    # added since; bring them up to date in place.
+    existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, kind in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {kind}")
+
+
+def get_meta(pool, key, default=None):
+    with pool.cursor() as cursor:
+        cursor.execute("SELECT value FROM meta WHERE key = %s", (key,))
+        row = cursor.fetchone()
+    return row["value"] if row else default
+
+
+def set_meta(cursor, key, value):
+    cursor.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (%s, %s)", (key, str(value)))
+
+
+def dedupe_users(pool):
+    # One-shot cleanup before the unique email index can be created: per
+    # email the confirmed row wins, then the newest (latest hash).
+    if get_meta(pool, "users_deduped") is not None:
+        return 0
+    with pool.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM users WHERE id NOT IN (SELECT id FROM ("
+            "SELECT id, ROW_NUMBER() OVER (PARTITION BY email ORDER BY confirmed DESC, id DESC) AS rank "
+            "FROM users) WHERE rank = 1)"
+        )
+        removed = cursor.rowcount
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email ON users(email)")
+        set_meta(cursor, "users_deduped", removed)
+    if removed:
+        print(f"maize.db: removed {removed} duplicate user row(s), kept the confirmed/newest per email")
+    return removed
+
+
+def migrate_json(pool, path=None):
+    # One-shot import of the old data.json fallback store.
+    path = path or LEGACY_DATA_FILE
+    if get_meta(pool, "json_migrated") or not os.path.exists(path):
+        return 0
+    with open(path, "r") as f:
+        users = json.load(f).get("users", [])
+    with pool.cursor() as cursor:
+        cursor.executemany(
+            "INSERT OR IGNORE INTO users (email, password_hash, confirmation_code, confirmed) VALUES (%s, %s, %s, %s)",
+            [(u["email"], u["password_hash"], u["confirmation_code"], u.get("confirmed", False)) for u in users]
+        )
+        set_meta(cursor, "json_migrated", len(users))
+    return len(users)
@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+import uuid
+from email.message import EmailMessage
+
+import local_store
+
+# ----------------- EMAIL CONFIG -----------------
+EMAIL_ADDRESS = os.environ.get("AGRIPRICE_EMAIL_ADDRESS", "")
+EMAIL_PASSWORD = os.environ.get("AGRIPRICE_EMAIL_PASSWORD", "")
+SMTP_HOST = os.environ.get("AGRIPRICE_SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get("AGRIPRICE_SMTP_PORT", "465"))
+# Set AGRIPRICE_SMTP_SSL=0 to talk plain SMTP to a local debugging server.
+SMTP_SSL = os.environ.get("AGRIPRICE_SMTP_SSL", "1") != "0"
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+RETRY_BASE = 2.0
+IDLE_TIMEOUT = 60
+# A claimed row whose worker died is handed out again after this long.
+LEASE_SECONDS = 300
+
+
+# ----------------- OUTBOX -----------------
+def enqueue(recipient, subject, body):
+    with local_store.store().cursor() as cursor:
+        cursor.execute("INSERT INTO mail_outbox (recipient, subject, body) VALUES (%s, %s, %s)",
+                       (recipient, subject, body))
+        mail_id = cursor.lastrowid
+    worker().wake()
+    return mail_id
+
+
+def send_status(mail_id):
+    # Row with status ("queued", "retrying", "sending", "sent" or "failed"),
+    # attempts and last_error; None for an unknown id.
+    worker()
+    with local_store.store().cursor() as cursor:
+        cursor.execute("SELECT status, attempts, last_error FROM mail_outbox WHERE id = %s", (mail_id,))
+        return cursor.fetchone()
+
+
+def _claim(limit):
+    # Atomically marks up to `limit` due rows as "sending" under a fresh
+    # claim id and returns only those, so workers in other processes sharing
+    # maize.db never pick the same mail. Rows stuck in "sending" past the
+    # lease (their worker died) are due again.
+    claim = uuid.uuid4().hex
+    now = time.time()
+    with local_store.store().cursor() as cursor:
+        cursor.execute("UPDATE mail_outbox SET status='sending', claimed_by=%s, claimed_at=%s "
+                       "WHERE id IN (SELECT id FROM mail_outbox "
+                       "WHERE (status IN ('queued', 'retrying') AND next_attempt <= %s) "
+                       "OR (status = 'sending' AND claimed_at < %s) ORDER BY id LIMIT %s)",
+                       (claim, now, now, now - LEASE_SECONDS, limit))
+        cursor.execute("SELECT id, recipient, subject, body, attempts, claimed_by FROM mail_outbox "
+                       "WHERE claimed_by = %s AND status = 'sending' ORDER BY id", (claim,))
+        return cursor.fetchall()
+
+
+def _mark(mail, status, attempts, next_attempt, error):
+    # Only while the claim is still ours; a lease that expired mid-send has
+    # been handed to another worker.
+    with local_store.store().cursor() as cursor:
+        cursor.execute("UPDATE mail_outbox SET status=%s, attempts=%s, next_attempt=%s, last_error=%s "
+                       "WHERE id=%s AND claimed_by=%s",
+                       (status, attempts, next_attempt, error, mail["id"], mail["claimed_by"]))
+
+
+# ----------------- WORKER -----------------
+class MailWorker(threading.Thread):
+    # Drains the outbox in batches over one authenticated SMTP connection
+    # that is kept open between batches and re-opened when it drops.
+
+    def __init__(self):
+        super().__init__(name="agriprice-mailer", daemon=True)
+        self._wakeup = threading.Event()
+        self._smtp = None
+        self._last_used = 0
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _connection(self):
+        import smtplib
+
+        if self._smtp is not None:
+            try:
+                self._smtp.noop()
+                return self._smtp
+            except smtplib.SMTPException:
+                self._close()
+        if SMTP_SSL:
+            smtp = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=10)
+        else:
+            smtp = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10)
+        if EMAIL_PASSWORD:
+            smtp.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
+        self._smtp = smtp
+        return smtp
+
+    def _close(self):
+        try:
+            self._smtp.quit()
+        except Exception:
+            pass
+        self._smtp = None
+
+    def send_batch(self):
+        batch = _claim(BATCH_SIZE)
+        for mail in batch:
+            msg = EmailMessage()
+            msg["Subject"] = mail["subject"]
+            msg["From"] = EMAIL_ADDRESS
+            msg["To"] = mail["recipient"]
+            msg.set_content(mail["body"])
+            attempts = mail["attempts"] + 1
+            try:
+                self._connection().send_message(msg)
+                result = ("sent", attempts, 0, None)
+            except Exception as e:
+                self._close()
+                status = "failed" if attempts >= MAX_ATTEMPTS else "retrying"
+                result = (status, attempts, time.time() + RETRY_BASE ** attempts, str(e))
+            # Marked one by one: a crash can re-send at most the mail in flight.
+            _mark(mail, *result)
+            self._last_used = time.time()
+        return len(batch)
+
+    def run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                sent = self.send_batch()
+            except Exception:
+                sent = 0
+            if sent == BATCH_SIZE:
+                continue
+            if self._smtp is not None and time.time() - self._last_used > IDLE_TIMEOUT:
+                self._close()
+            self._wakeup.wait(timeout=RETRY_BASE)
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def worker():
+    # Started by the first enqueue, send_status or start_worker in the
+    # process, so rows a previous process left queued or retrying drain
+    # without waiting for a new mail.
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = MailWorker()
+            _worker.start()
+        return _worker
+
+
+def start_worker():
+    worker()
+
+
+# ----------------- MESSAGES -----------------
+def send_confirmation_email(recipient, code):
+    return enqueue(recipient, "Confirm your AgriPrice account", f"Your confirmation code is: {code}")
+
+
+def send_reset_code_email(recipient, reset_code):
+    return enqueue(recipient, "AgriPrice Password Reset Code", f"Use this code to reset your password: {reset_code}")
@@ -0,0 +1,256 @@
+import argparse
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+import pandas as pd
+
+import metrics
+from model_registry import ModelRegistry, registry
+
+# ----------------- CONFIG -----------------
+# Market data for every (crop, region) lives in one Hive-style Parquet tree:
+#   market_data/crop=maize/region=Mbeya/year=2018/part-<id>-0.parquet
+# and each pair gets its own model bundle under models/<crop>/<region>/.
+DATA_ROOT = os.environ.get("AGRIPRICE_DATA_ROOT", "market_data")
+MODELS_ROOT = os.environ.get("AGRIPRICE_MODELS_ROOT", "models")
+MODEL_CACHE_SIZE = int(os.environ.get("AGRIPRICE_MODEL_CACHE_SIZE", "16"))
+IMPORT_CHUNK_ROWS = 1_000_000
+DEFAULT_CROP = "maize"
+DEFAULT_REGION = "Mbeya"
+# maize_data.csv names the population column after its one region; the
+# partitioned layout uses a region-neutral name.
+LEGACY_COLUMNS = {"Mbeya_Population": "Population"}
+REGION_FEATURES = ["Year", "Rainfall_mm", "Total_Production_MT", "Population"]
+# Stored as float64 everywhere so files written from different sources share
+# one schema (an all-integer CSV chunk would otherwise infer int64).
+MEASURE_COLUMNS = ["Rainfall_mm", "Total_Production_MT", "Population", "Cost_Tsh_per_kg"]
+
+
+def _partitioning():
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    schema = pa.schema([("crop", pa.string()), ("region", pa.string()), ("year", pa.int32())])
+    return ds.partitioning(schema, flavor="hive")
+
+
+# ----------------- STORAGE -----------------
+def write_partitioned(frame, root=DATA_ROOT):
+    # Appends `frame` (crop, region and Year columns plus the measures) to the
+    # tree. Every call writes new uniquely named files, so repeated imports of
+    # daily prices never rewrite existing partitions.
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    frame = frame.rename(columns={"Year": "year"})
+    frame["year"] = frame["year"].astype("int32")
+    for col in MEASURE_COLUMNS:
+        if col in frame:
+            frame[col] = frame[col].astype("float64")
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    ds.write_dataset(table, root, format="parquet", partitioning=_partitioning(),
+                     basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+                     existing_data_behavior="overwrite_or_ignore")
+    return len(frame)
+
+
+def read_partitioned(root=DATA_ROOT, crop=None, region=None, years=None, columns=None):
+    # Predicate pushdown: crop/region/year filters prune whole directories
+    # before any file is opened, and only the requested columns are decoded.
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(root, format="parquet", partitioning=_partitioning())
+    conditions = []
+    if crop is not None:
+        conditions.append(ds.field("crop") == crop)
+    if region is not None:
+        conditions.append(ds.field("region") == region)
+    if years is not None:
+        conditions.append(ds.field("year").isin([int(year) for year in years]))
+    condition = None
+    for part in conditions:
+        condition = part if condition is None else condition & part
+    if columns is not None:
+        columns = ["year" if col == "Year" else col for col in columns]
+    frame = dataset.to_table(columns=columns, filter=condition).to_pandas()
+    return frame.rename(columns={"year": "Year"})
+
+
+def import_csv(path, crop=DEFAULT_CROP, region=DEFAULT_REGION, root=DATA_ROOT, chunk_rows=IMPORT_CHUNK_ROWS):
+    # Loads a maize_data.csv style file into the tree, chunk by chunk. Files
+    # that already carry crop/region columns keep their own values.
+    rows = 0
+    for chunk in pd.read_csv(path, chunksize=chunk_rows):
+        chunk = chunk.rename(columns=LEGACY_COLUMNS)
+        if "crop" not in chunk:
+            chunk["crop"] = crop
+        if "region" not in chunk:
+            chunk["region"] = region
+        rows += write_partitioned(chunk, root)
+    return rows
+
+
+def partitions(root=DATA_ROOT):
+    # (crop, region) pairs present in the tree, from directory names alone.
+    found = []
+    if not os.path.isdir(root):
+        return found
+    for crop_dir in sorted(os.listdir(root)):
+        if not crop_dir.startswith("crop="):
+            continue
+        for region_dir in sorted(os.listdir(os.path.join(root, crop_dir))):
+            if region_dir.startswith("region="):
+                found.append((crop_dir[len("crop="):], region_dir[len("region="):]))
+    return found
+
+
+# ----------------- MODELS -----------------
+def model_path(crop, region, root=MODELS_ROOT):
+    return os.path.join(root, crop, region, "model.pkl")
+
+
+def available_models(root=MODELS_ROOT):
+    # (crop, region) pairs with a trained bundle; the legacy model.pkl always
+    # serves the default pair.
+    found = {(DEFAULT_CROP, DEFAULT_REGION)}
+    if os.path.isdir(root):
+        for crop in os.listdir(root):
+            crop_dir = os.path.join(root, crop)
+            if os.path.isdir(crop_dir):
+                found.update((crop, region) for region in os.listdir(crop_dir)
+                             if os.path.exists(model_path(crop, region, root)))
+    return sorted(found)
+
+
+class ModelCache:
+    # LRU of per-(crop, region) ModelRegistry instances. Only `capacity`
+    # bundles are held at once; evicting a registry drops its model and data
+    # frame, and the next request for that pair reloads it from disk. Each
+    # cached registry still hot-reloads when its model.pkl is replaced.
+
+    def __init__(self, root=MODELS_ROOT, capacity=MODEL_CACHE_SIZE):
+        self.root = root
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._registries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._registries)
+
+    def registry(self, crop, region):
+        key = (crop, region)
+        with self._lock:
+            found = self._registries.get(key)
+            if found is not None:
+                self._registries.move_to_end(key)
+                self.hits += 1
+                return found
+            self.misses += 1
+            path = model_path(crop, region, self.root)
+            if key == (DEFAULT_CROP, DEFAULT_REGION) and not os.path.exists(path):
+                found = registry
+            else:
+                found = ModelRegistry(path)
+            self._registries[key] = found
+            while len(self._registries) > self.capacity:
+                self._registries.popitem(last=False)
+                self.evictions += 1
+            return found
+
+    def get(self, crop, region):
+        return self.registry(crop, region).get()
+
+    def stats(self):
+        return {"model_cache_size": len(self._registries), "model_cache_hits": self.hits,
+                "model_cache_misses": self.misses, "model_cache_evictions": self.evictions}
+
+
+model_cache = ModelCache()
+metrics.register_collector(model_cache.stats)
+
+
+def model_for(crop, region):
+    return model_cache.get(crop, region)
+
+
+def train_partition(crop, region, root=DATA_ROOT, models_root=MODELS_ROOT, years=None, only=None, n_jobs=-1):
+    # Same selection and artifact layout as train.py, fitted on one
+    # (crop, region) slice read straight from the partitioned tree.
+    from datetime import datetime, timezone
+
+    import sklearn
+
+    import train
+    from prediction import TARGET
+
+    data = read_partitioned(root, crop, region, years, columns=REGION_FEATURES + [TARGET]).dropna()
+    if data.empty:
+        raise ValueError(f"No rows for crop={crop} region={region}")
+    bounds = train.iqr_bounds(data)
+    data = train.remove_outliers(data, bounds=bounds)
+    models = train.candidates()
+    if only:
+        models = {name: models[name] for name in only}
+    model, best, scores, interval, cv_scores = train.fit(data, models=models, n_jobs=n_jobs,
+                                                         features=REGION_FEATURES)
+    out = model_path(crop, region, models_root)
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    metadata = {
+        "trained_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "crop": crop,
+        "region": region,
+        "rows_used": int(len(data)),
+        "outlier_bounds": bounds,
+        "features": REGION_FEATURES,
+        "target": TARGET,
+        "estimator": type(model).__name__,
+        "candidate": best,
+        "sklearn_version": sklearn.__version__,
+        "metrics": scores,
+        "cv_scores": cv_scores,
+        "interval": interval,
+    }
+    train.save_bundle({"model": model, "data": data, "interval": interval, "metadata": metadata}, out)
+    return metadata
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Partitioned market data and per-(crop, region) models.")
+    parser.add_argument("--root", default=DATA_ROOT, help="partitioned Parquet tree")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    load = commands.add_parser("import", help="append a CSV to the partitioned tree")
+    load.add_argument("csv")
+    load.add_argument("--crop", default=DEFAULT_CROP)
+    load.add_argument("--region", default=DEFAULT_REGION)
+
+    fit = commands.add_parser("train", help="train one model per (crop, region)")
+    fit.add_argument("--crop", help="only this crop (default: every crop in the tree)")
+    fit.add_argument("--region", help="only this region (default: every region in the tree)")
+    fit.add_argument("--models", default=MODELS_ROOT)
+    fit.add_argument("--candidates", help="comma-separated subset of train.py candidates")
+    fit.add_argument("--jobs", type=int, default=-1)
+
+    commands.add_parser("list", help="list partitions and trained models")
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        print(json.dumps({"rows": import_csv(args.csv, args.crop, args.region, args.root)}))
+    elif args.command == "train":
+        only = args.candidates.split(",") if args.candidates else None
+        results = [train_partition(crop, region, args.root, args.models, only=only, n_jobs=args.jobs)
+                   for crop, region in partitions(args.root)
+                   if args.crop in (None, crop) and args.region in (None, region)]
+        print(json.dumps(results, indent=2))
+    else:
+        print(json.dumps({"partitions": partitions(args.root), "models": available_models()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
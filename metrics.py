@@ -0,0 +1,175 @@
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ----------------- CONFIG -----------------
+# Off by default: timer() then hands back a shared no-op context manager and
+# timed() returns the function undecorated, so disabled cost is ~nothing.
+ENABLED = os.environ.get("AGRIPRICE_METRICS", "0") == "1"
+METRICS_PORT = int(os.environ.get("AGRIPRICE_METRICS_PORT", "0"))
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.total, self.count
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+_collectors = []
+
+
+def observe(stage, seconds):
+    histogram = _histograms.get(stage)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(stage, Histogram())
+    histogram.observe(seconds)
+
+
+class _Timer:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(stage):
+    return _Timer(stage) if ENABLED else _NULL_TIMER
+
+
+def timed(stage):
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def register_collector(collect):
+    # collect() -> {metric_name: number}, exported as gauges alongside the
+    # stage histograms (cache hit counters, hashing queue depth, ...).
+    _collectors.append(collect)
+
+
+# ----------------- EXPORT -----------------
+def _gauges():
+    values = {}
+    for collect in _collectors:
+        try:
+            values.update(collect())
+        except Exception:
+            pass
+    return values
+
+
+def as_json():
+    stages = {}
+    for stage, histogram in sorted(_histograms.items()):
+        counts, total, count = histogram.snapshot()
+        stages[stage] = {
+            "count": count,
+            "sum": total,
+            "mean": total / count if count else 0.0,
+            "buckets": dict(zip([str(b) for b in histogram.buckets] + ["+Inf"], counts)),
+        }
+    return {"enabled": ENABLED, "stages": stages, "gauges": _gauges()}
+
+
+def as_prometheus():
+    lines = ["# TYPE agriprice_stage_seconds histogram"]
+    for stage, histogram in sorted(_histograms.items()):
+        counts, total, count = histogram.snapshot()
+        cumulative = 0
+        for bound, bucket_count in zip([str(b) for b in histogram.buckets] + ["+Inf"], counts):
+            cumulative += bucket_count
+            lines.append(f'agriprice_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'agriprice_stage_seconds_sum{{stage="{stage}"}} {total}')
+        lines.append(f'agriprice_stage_seconds_count{{stage="{stage}"}} {count}')
+    for name, value in sorted(_gauges().items()):
+        lines.append(f"# TYPE agriprice_{name} gauge")
+        lines.append(f"agriprice_{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") == "/metrics":
+            body, content_type = as_prometheus().encode(), "text/plain; version=0.0.4"
+        elif self.path.rstrip("/") == "/metrics.json":
+            body, content_type = json.dumps(as_json()).encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_server(port=METRICS_PORT):
+    # Streamlit has no routes of its own, so the app process exposes
+    # /metrics and /metrics.json on a side port when one is configured.
+    global _server
+    if not ENABLED or not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            except OSError:
+                return None
+            threading.Thread(target=_server.serve_forever, name="agriprice-metrics", daemon=True).start()
+        return _server
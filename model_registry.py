@@ -0,0 +1,96 @@
+import hashlib
+import os
+import threading
+
+import joblib
+import numpy as np
+import pandas as pd
+
+MODEL_FILE = "model.pkl"
+
+
+def file_stamp(path):
+    info = os.stat(path)
+    return (info.st_mtime_ns, info.st_size)
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def data_path(model_path):
+    root, _ = os.path.splitext(model_path)
+    return root + ".data.npy"
+
+
+def load_data(path):
+    # Training frame stored as a structured .npy record array, opened as a
+    # read-only memmap so only the pages that are touched get read.
+    records = np.load(path, mmap_mode="r")
+    return pd.DataFrame({name: np.asarray(records[name]) for name in records.dtype.names})
+
+
+class Bundle(dict):
+    # Split artifacts keep the training frame out of model.pkl; it is only
+    # read from disk the first time bundle["data"] is used.
+
+    def __init__(self, values, path):
+        super().__init__(values)
+        self._path = path
+        self._data_lock = threading.Lock()
+
+    def __missing__(self, key):
+        if key != "data" or "data_file" not in self:
+            raise KeyError(key)
+        with self._data_lock:
+            if "data" not in self:
+                # incremental.py publishes new rows as extra files listed in
+                # "data_appends" instead of rewriting the whole history.
+                directory = os.path.dirname(os.path.abspath(self._path))
+                frames = [load_data(os.path.join(directory, name))
+                          for name in [self["data_file"], *self.get("data_appends", ())]]
+                self["data"] = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+        return dict.__getitem__(self, "data")
+
+
+class ModelRegistry:
+    # One in-memory copy of the {"model", "data"} bundle per process, shared by
+    # every Streamlit session. The file is only unpickled again when its
+    # mtime/size changes *and* its content hash differs from the loaded one.
+
+    def __init__(self, path=MODEL_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._bundle = None
+        self._stamp = None
+        self._listeners = []
+
+    @property
+    def version(self):
+        return self._bundle["version"] if self._bundle else None
+
+    def on_reload(self, callback):
+        self._listeners.append(callback)
+
+    def get(self):
+        stamp = file_stamp(self.path)
+        if stamp == self._stamp:
+            return self._bundle
+        with self._lock:
+            if stamp != self._stamp:
+                version = file_hash(self.path)
+                if self._bundle is None or version != self._bundle["version"]:
+                    bundle = Bundle(joblib.load(self.path), self.path)
+                    bundle["version"] = version
+                    self._bundle = bundle
+                    for callback in self._listeners:
+                        callback(bundle)
+                self._stamp = stamp
+        return self._bundle
+
+
+registry = ModelRegistry()
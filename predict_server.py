@@ -0,0 +1,162 @@
+import asyncio
+import json
+import os
+
+import numpy as np
+
+import metrics
+from model_registry import registry
+from prediction import FEATURE_COLUMNS, interval_offsets, predict_matrix
+
+# ----------------- CONFIG -----------------
+# Concurrent requests that arrive within MAX_WAIT seconds of each other are
+# coalesced into one model.predict call of at most MAX_BATCH rows.
+MAX_BATCH = int(os.environ.get("AGRIPRICE_MAX_BATCH", "1024"))
+MAX_WAIT = float(os.environ.get("AGRIPRICE_MAX_WAIT_MS", "2")) / 1000
+MAX_BODY = 8 * 1024 * 1024
+
+REQUEST_KEYS = ["year", "rainfall", "production", "population"]
+
+
+class MicroBatcher:
+    def __init__(self, max_batch=MAX_BATCH, max_wait=MAX_WAIT):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = None
+        self._task = None
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def predict(self, rows):
+        self._ensure_running()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((rows, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        size = len(batch[0][0])
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while size < self.max_batch:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            try:
+                features = np.vstack([rows for rows, _ in batch])
+                with metrics.timer("server_predict_batch"):
+                    prices = predict_matrix(registry.get()["model"], features)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            start = 0
+            for rows, future in batch:
+                end = start + len(rows)
+                if not future.done():
+                    future.set_result(prices[start:end])
+                start = end
+
+
+batcher = MicroBatcher()
+
+
+def parse_rows(payload):
+    # Accepts {"year":..,"rainfall":..,"production":..,"population":..},
+    # {"features": [y, r, p, n]} or {"rows": [[y, r, p, n], ...]}.
+    if "rows" in payload:
+        rows = payload["rows"]
+    elif "features" in payload:
+        rows = [payload["features"]]
+    else:
+        missing = [key for key in REQUEST_KEYS if key not in payload]
+        if missing:
+            raise ValueError(f"missing field(s): {', '.join(missing)}")
+        rows = [[payload[key] for key in REQUEST_KEYS]]
+    features = np.asarray(rows, dtype=float)
+    if features.ndim != 2 or features.shape[1] != len(FEATURE_COLUMNS) or not len(features):
+        raise ValueError(f"expected rows of {len(FEATURE_COLUMNS)} features: {', '.join(FEATURE_COLUMNS)}")
+    return features
+
+
+# ----------------- ASGI APP -----------------
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if len(body) > MAX_BODY:
+            raise ValueError("request body too large")
+        if not message.get("more_body"):
+            return body
+
+
+async def respond(send, status, payload, content_type=b"application/json"):
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                registry.get()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    path, method = scope["path"].rstrip("/"), scope["method"]
+    if path == "/health" and method == "GET":
+        return await respond(send, 200, {"status": "ok", "model_version": registry.version})
+    if path == "/metrics" and method == "GET":
+        return await respond(send, 200, metrics.as_prometheus().encode(), b"text/plain; version=0.0.4")
+    if path == "/metrics.json" and method == "GET":
+        return await respond(send, 200, metrics.as_json())
+    if path not in ("/predict", "/predict/batch"):
+        return await respond(send, 404, {"error": "not found"})
+    if method != "POST":
+        return await respond(send, 405, {"error": "method not allowed"})
+
+    try:
+        features = parse_rows(json.loads(await read_body(receive)))
+    except (ValueError, KeyError, TypeError) as e:
+        return await respond(send, 400, {"error": str(e)})
+    try:
+        prices = await batcher.predict(features)
+    except Exception as e:
+        return await respond(send, 500, {"error": str(e)})
+
+    lower, upper = interval_offsets(registry.get())
+    if path == "/predict":
+        price = float(prices[0])
+        return await respond(send, 200, {"price": price, "lower": price + lower, "upper": price + upper,
+                                         "model_version": registry.version})
+    return await respond(send, 200, {"prices": prices.tolist(), "lower": (prices + lower).tolist(),
+                                     "upper": (prices + upper).tolist(), "model_version": registry.version})
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=os.environ.get("AGRIPRICE_HOST", "127.0.0.1"),
+                port=int(os.environ.get("AGRIPRICE_PORT", "8600")), log_level="warning")
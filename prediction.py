@@ -0,0 +1,298 @@
+import io
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from model_registry import registry
+
+FEATURE_COLUMNS = ["Year", "Rainfall_mm", "Total_Production_MT", "Mbeya_Population"]
+PREDICTION_COLUMN = "Predicted_Cost_Tsh_per_kg"
+LOWER_COLUMN = "Lower_Cost_Tsh_per_kg"
+UPPER_COLUMN = "Upper_Cost_Tsh_per_kg"
+TARGET = "Cost_Tsh_per_kg"
+CHUNK_ROWS = 100_000
+INTERVAL_LEVEL = 0.9
+CACHE_SIZE = int(os.environ.get("AGRIPRICE_PREDICTION_CACHE_SIZE", "4096"))
+CACHE_TTL = float(os.environ.get("AGRIPRICE_PREDICTION_CACHE_TTL", "3600"))
+SURFACE_STEPS = 50
+SURFACE_CACHE_SIZE = 64
+SIMULATION_PERCENTILES = (5, 25, 50, 75, 95)
+SIMULATION_CACHE_SIZE = 32
+SIMULATION_SEED = 0
+
+
+def model_features(model):
+    # Input columns, in order, that `model` was fitted on. Per-region models
+    # call population "Population"; models without recorded names use the
+    # maize_data.csv layout.
+    names = getattr(model, "feature_names_in_", None)
+    return list(FEATURE_COLUMNS) if names is None else list(names)
+
+
+def feature_matrix(frame, columns=FEATURE_COLUMNS):
+    missing = [col for col in columns if col not in frame.columns]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+    return frame[columns].to_numpy(dtype=float)
+
+
+def predict_matrix(model, features):
+    # One vectorized predict over the whole (n, 4) matrix. Column names are
+    # re-attached only when the model was fitted on a DataFrame, using the
+    # model's own names (per-region models call population "Population").
+    if hasattr(model, "feature_names_in_"):
+        features = pd.DataFrame(features, columns=model.feature_names_in_)
+    return model.predict(features)
+
+
+def conformal_offsets(y_true, y_pred, level=INTERVAL_LEVEL):
+    # Split-conformal interval from held-out residuals: price bounds are
+    # prediction + lower and prediction + upper.
+    residuals = np.sort(np.asarray(y_true, dtype=float) - np.asarray(y_pred, dtype=float))
+    n = len(residuals)
+    tail = (1 - level) / 2
+    lo = max(int(np.floor((n + 1) * tail)) - 1, 0)
+    hi = min(int(np.ceil((n + 1) * (1 - tail))) - 1, n - 1)
+    return {"level": level, "lower": float(residuals[lo]), "upper": float(residuals[hi]), "n": n}
+
+
+def interval_offsets(bundle):
+    # (lower, upper) residual offsets of the split-conformal interval stored
+    # by train.py. Bundles trained before that fall back to in-sample
+    # residuals over their "data" frame, computed once per model version.
+    interval = bundle.get("interval")
+    if interval is None:
+        interval = _fallback_intervals.get(bundle["version"])
+    if interval is None:
+        data = bundle["data"]
+        model = bundle["model"]
+        interval = conformal_offsets(data[TARGET], predict_matrix(model, feature_matrix(data, model_features(model))))
+        _fallback_intervals[bundle["version"]] = interval
+    return interval["lower"], interval["upper"]
+
+
+_fallback_intervals = {}
+
+
+def predict_frame(model, frame, offsets=None):
+    result = frame.copy()
+    prices = predict_matrix(model, feature_matrix(frame, model_features(model)))
+    result[PREDICTION_COLUMN] = prices
+    if offsets is not None:
+        result[LOWER_COLUMN] = prices + offsets[0]
+        result[UPPER_COLUMN] = prices + offsets[1]
+    return result
+
+
+def parameter_grid(years, rainfall, production, population, columns=FEATURE_COLUMNS):
+    # Cartesian product of the four inputs, one scenario per row, named
+    # after `columns` (pass model_features(model) for per-region models).
+    mesh = np.meshgrid(years, rainfall, production, population, indexing="ij")
+    return pd.DataFrame({col: axis.ravel() for col, axis in zip(columns, mesh)})
+
+
+def predict_csv(model, source, chunk_rows=CHUNK_ROWS, offsets=None):
+    # Reads scenarios in the maize_data.csv layout chunk by chunk and yields
+    # CSV text with a prediction column appended, header first.
+    header = True
+    for chunk in pd.read_csv(source, chunksize=chunk_rows):
+        buffer = io.StringIO()
+        predict_frame(model, chunk, offsets).to_csv(buffer, index=False, header=header)
+        header = False
+        yield buffer.getvalue()
+
+
+class PredictionCache:
+    # Bounded LRU with a TTL, shared by every session in the process. Keys
+    # include the model version, so a reloaded model.pkl never serves stale
+    # prices even before clear() runs.
+
+    def __init__(self, size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[1] > now:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            if item is not None:
+                del self._items[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = (value, time.monotonic() + self.ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def clear(self, *_):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._items)}
+
+
+prediction_cache = PredictionCache()
+registry.on_reload(prediction_cache.clear)
+metrics.register_collector(lambda: {"prediction_cache_" + key: value
+                                    for key, value in prediction_cache.stats().items()})
+
+
+def predict_price(bundle, year, rainfall, production, population):
+    key = (bundle["version"], float(year), float(rainfall), float(production), float(population))
+    price = prediction_cache.get(key)
+    if price is None:
+        price = float(predict_matrix(bundle["model"], np.array([key[1:]]))[0])
+        prediction_cache.put(key, price)
+    return price
+
+
+surface_cache = PredictionCache(size=SURFACE_CACHE_SIZE)
+registry.on_reload(surface_cache.clear)
+
+
+def response_surface(bundle, year, population, steps=SURFACE_STEPS):
+    # Price over a rainfall × production grid spanning the training data, for
+    # one year and population: steps² rows through a single predict, cached
+    # per model version so sliders on the page never re-run the model.
+    key = (bundle["version"], float(year), float(population), int(steps))
+    surface = surface_cache.get(key)
+    if surface is None:
+        data = bundle["data"]
+        rainfall = np.linspace(data["Rainfall_mm"].min(), data["Rainfall_mm"].max(), steps)
+        production = np.linspace(data["Total_Production_MT"].min(), data["Total_Production_MT"].max(), steps)
+        rain, prod = np.meshgrid(rainfall, production)
+        features = np.column_stack([np.full(rain.size, float(year)), rain.ravel(), prod.ravel(),
+                                    np.full(rain.size, float(population))])
+        prices = predict_matrix(bundle["model"], features).reshape(rain.shape)
+        surface = {"rainfall": rainfall, "production": production, "prices": prices}
+        surface_cache.put(key, surface)
+    return surface
+
+
+def surface_chart(surface):
+    # ECharts heatmap: x = rainfall, y = production, colour = price.
+    prices = surface["prices"]
+    rows, cols = np.indices(prices.shape)
+    cells = [[x, y, price] for x, y, price in
+             zip(cols.ravel().tolist(), rows.ravel().tolist(), prices.round(1).ravel().tolist())]
+    return {
+        "tooltip": {"position": "top"},
+        "grid": {"bottom": 90, "left": 90},
+        "xAxis": {"type": "category", "name": "Rainfall (mm)", "data": [f"{v:.0f}" for v in surface["rainfall"]]},
+        "yAxis": {"type": "category", "name": "Production (MT)",
+                  "data": [f"{v:,.0f}" for v in surface["production"]]},
+        "visualMap": {"min": float(prices.min()), "max": float(prices.max()), "calculable": True,
+                      "orient": "horizontal", "left": "center", "bottom": 0},
+        "series": [{"name": "Price (Tsh/kg)", "type": "heatmap", "data": cells}],
+    }
+
+
+def simulate_prices(bundle, year, population, samples=50_000, method="empirical", seed=None,
+                    chunk_rows=CHUNK_ROWS):
+    # Monte Carlo over rainfall/production: "empirical" resamples (rainfall,
+    # production) rows of the training data, keeping their joint shape;
+    # "normal" draws from a bivariate normal fitted to them. Sampling and
+    # predicting go chunk by chunk, so memory stays at one chunk of features
+    # plus the (samples,) price array.
+    data = bundle["data"][["Rainfall_mm", "Total_Production_MT"]].to_numpy(dtype=float)
+    rng = np.random.default_rng(seed)
+    if method == "normal":
+        mean, cov = data.mean(axis=0), np.cov(data, rowvar=False)
+    prices = np.empty(samples)
+    features = np.empty((min(chunk_rows, samples), 4))
+    features[:, 0] = year
+    features[:, 3] = population
+    for start in range(0, samples, chunk_rows):
+        rows = min(chunk_rows, samples - start)
+        if method == "normal":
+            features[:rows, 1:3] = np.maximum(rng.multivariate_normal(mean, cov, size=rows), 0.0)
+        else:
+            features[:rows, 1:3] = data[rng.integers(0, len(data), rows)]
+        prices[start:start + rows] = predict_matrix(bundle["model"], features[:rows])
+    return prices
+
+
+def distribution_chart(prices, bins=40, percentiles=SIMULATION_PERCENTILES):
+    # Histogram of simulated prices with percentile markers.
+    counts, edges = np.histogram(prices, bins=bins)
+    centers = (edges[:-1] + edges[1:]) / 2
+    marks = np.percentile(prices, percentiles)
+    return {
+        "tooltip": {"trigger": "axis"},
+        "xAxis": {"type": "category", "name": "Price (Tsh/kg)", "data": [f"{v:,.0f}" for v in centers]},
+        "yAxis": {"type": "value", "name": "Samples"},
+        "series": [{
+            "name": "Samples",
+            "type": "bar",
+            "barCategoryGap": "0%",
+            "data": counts.tolist(),
+            "markLine": {
+                "symbol": "none",
+                "data": [{"name": f"P{p}", "xAxis": int(min(np.searchsorted(edges, mark, side="right") - 1, bins - 1)),
+                          "label": {"formatter": f"P{p}"}} for p, mark in zip(percentiles, marks)],
+            },
+        }],
+    }
+
+
+simulation_cache = PredictionCache(size=SIMULATION_CACHE_SIZE)
+registry.on_reload(simulation_cache.clear)
+
+
+def simulation_summary(bundle, year, population, samples=50_000, method="empirical"):
+    # Percentiles, mean/std and the histogram payload of simulate_prices with
+    # a fixed seed, cached per model version and inputs: page reruns reuse
+    # them instead of drawing and predicting `samples` rows again, and only
+    # the summary is kept, not the price array.
+    key = (bundle["version"], float(year), float(population), int(samples), method)
+    summary = simulation_cache.get(key)
+    if summary is None:
+        prices = simulate_prices(bundle, year, population, samples, method, seed=SIMULATION_SEED)
+        summary = {"percentiles": np.percentile(prices, SIMULATION_PERCENTILES), "mean": float(prices.mean()),
+                   "std": float(prices.std()), "chart": distribution_chart(prices)}
+        simulation_cache.put(key, summary)
+    return summary
+
+
+def benchmark(model, sizes=(1, 1_000, 100_000, 1_000_000), repeat=3):
+    rng = np.random.default_rng(0)
+    results = []
+    for rows in sizes:
+        features = np.column_stack([
+            rng.integers(2000, 2040, rows),
+            rng.uniform(800, 2600, rows),
+            rng.uniform(400_000, 900_000, rows),
+            rng.uniform(2_600_000, 2_900_000, rows),
+        ])
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            predict_matrix(model, features)
+            best = min(best, time.perf_counter() - started)
+        results.append({"rows": rows, "seconds": best, "rows_per_second": rows / best})
+    return results
+
+
+if __name__ == "__main__":
+    json.dump(benchmark(registry.get()["model"]), sys.stdout, indent=2)
+    print()
@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+
+import local_store
+import metrics
+
+# ----------------- CONFIG -----------------
+# Token buckets checked before any bcrypt work. Each scope is
+# (burst capacity, tokens refilled per second).
+ENABLED = os.environ.get("AGRIPRICE_RATE_LIMIT", "1") == "1"
+LIMITS = {
+    "login_email": (5, 5 / 60),
+    "login_client": (20, 20 / 60),
+    "register_client": (3, 3 / 600),
+    "register_email": (3, 3 / 3600),
+}
+# Buckets are kept in memory; every SYNC_MS the spent tokens are pushed to
+# maize.db and recently used buckets are read back, so all workers sharing
+# the database converge on one budget per key.
+SHARED = os.environ.get("AGRIPRICE_RATE_LIMIT_SHARED", "1") == "1"
+SYNC_MS = int(os.environ.get("AGRIPRICE_RATE_LIMIT_SYNC_MS", "1000"))
+MAX_KEYS = 100_000
+
+
+def _refill(scope, tokens, updated, now):
+    capacity, rate = LIMITS[scope]
+    return min(capacity, tokens + (now - updated) * rate)
+
+
+class RateLimiter:
+    def __init__(self, shared=SHARED, sync_ms=SYNC_MS):
+        self.shared = shared
+        self.sync_ms = sync_ms
+        self.allowed = 0
+        self.rejected = 0
+        self.refunded = 0
+        self._buckets = {}
+        self._spent = {}
+        self._lock = threading.Lock()
+        self._synced_at = 0.0
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def acquire(self, scope, key):
+        # Takes one token from the (scope, key) bucket. Returns 0.0 when
+        # allowed, otherwise the seconds until a token is available. Pure
+        # in-memory work; the database is only touched by the sync thread.
+        if not ENABLED:
+            return 0.0
+        capacity, rate = LIMITS[scope]
+        name = f"{scope}:{key}"
+        now = time.time()
+        with self._lock:
+            bucket = self._buckets.get(name)
+            tokens = capacity if bucket is None else _refill(scope, bucket[0], bucket[1], now)
+            if tokens < 1:
+                self._buckets[name] = [tokens, now]
+                self.rejected += 1
+                return (1 - tokens) / rate
+            self._buckets[name] = [tokens - 1, now]
+            self._spent[name] = self._spent.get(name, 0) + 1
+            self.allowed += 1
+            if len(self._buckets) > MAX_KEYS:
+                self._prune(now)
+        if self.shared:
+            self._ensure_running()
+        return 0.0
+
+    def refund(self, scope, key):
+        # Gives back a token taken by acquire() for an attempt that was
+        # turned away before doing the work the limit protects. Tokens already
+        # pushed to the shared table stay spent there.
+        if not ENABLED:
+            return
+        name = f"{scope}:{key}"
+        with self._lock:
+            bucket = self._buckets.get(name)
+            if bucket is not None:
+                bucket[0] = min(LIMITS[scope][0], bucket[0] + 1)
+            if self._spent.get(name):
+                self._spent[name] -= 1
+            self.refunded += 1
+
+    def _prune(self, now):
+        # A bucket that has refilled to capacity is the same as no bucket.
+        for name, (tokens, updated) in list(self._buckets.items()):
+            scope = name.split(":", 1)[0]
+            if name not in self._spent and _refill(scope, tokens, updated, now) >= LIMITS[scope][0]:
+                del self._buckets[name]
+
+    def sync(self):
+        with self._lock:
+            spent, self._spent = self._spent, {}
+        now = time.time()
+        horizon = now - max(capacity / rate for capacity, rate in LIMITS.values())
+        with local_store.store().cursor() as cursor:
+            for name, count in spent.items():
+                capacity, rate = LIMITS[name.split(":", 1)[0]]
+                cursor.execute(
+                    "INSERT INTO rate_limits (key, tokens, updated) VALUES (%s, %s, %s) "
+                    "ON CONFLICT(key) DO UPDATE SET "
+                    "tokens = MIN(%s, tokens + (excluded.updated - updated) * %s) - %s, updated = excluded.updated",
+                    (name, capacity - count, now, capacity, rate, count),
+                )
+            cursor.execute("DELETE FROM rate_limits WHERE updated < %s", (horizon,))
+            # Only rows changed since the last sync (with some slack for other
+            # workers' in-flight pushes); the first sync reads them all.
+            cursor.execute("SELECT key, tokens, updated FROM rate_limits WHERE updated >= %s",
+                           (self._synced_at - 2 * self.sync_ms / 1000,))
+            rows = cursor.fetchall()
+        self._synced_at = now
+        with self._lock:
+            # Shared state plus whatever this process spent since the push.
+            for row in rows:
+                name = row["key"]
+                scope = name.split(":", 1)[0]
+                if scope in LIMITS:
+                    tokens = _refill(scope, row["tokens"], row["updated"], now)
+                    self._buckets[name] = [tokens - self._spent.get(name, 0), now]
+            self._prune(now)
+        return len(spent)
+
+    def _ensure_running(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="agriprice-rate-limit", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.sync_ms / 1000)
+            try:
+                self.sync()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {"rate_limit_allowed": self.allowed, "rate_limit_rejected": self.rejected,
+                    "rate_limit_refunded": self.refunded, "rate_limit_keys": len(self._buckets)}
+
+
+limiter = RateLimiter()
+metrics.register_collector(limiter.stats)
+
+
+def acquire(scope, key):
+    return limiter.acquire(scope, key)
+
+
+def refund(scope, key):
+    limiter.refund(scope, key)
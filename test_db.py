@@ -0,0 +1,51 @@
+import sqlite3
+
+import pytest
+
+import db
+
+
+@pytest.fixture
+def process_pool():
+    # Installs a pool as the process-wide MySQL pool for one test.
+    installed = []
+
+    def install(pool):
+        db.pool = pool
+        installed.append(pool)
+        return pool
+
+    yield install
+    db.pool = None
+    for pool in installed:
+        pool.close()
+
+
+def test_saturated_pool_stays_connected(tmp_path, process_pool):
+    pool = process_pool(db.sqlite_pool(str(tmp_path / "users.db"), size=1))
+    pool.timeout = 0.05
+    with pool.connection():
+        db.HealthMonitor(factory=None).check()
+    assert db.connected()
+
+
+def test_lost_server_fails_over(process_pool):
+    def connect():
+        raise sqlite3.OperationalError("unable to open database file")
+
+    process_pool(db.ConnectionPool(connect, size=1, errors=sqlite3))
+    db.HealthMonitor(factory=None).check()
+    assert not db.connected()
+
+
+def test_request_checkout_uses_request_connect(tmp_path):
+    timeouts = []
+
+    def connect(timeout):
+        timeouts.append(timeout)
+        return sqlite3.connect(str(tmp_path / "users.db"), check_same_thread=False)
+
+    pool = db.ConnectionPool(lambda: connect(3), request_connect=lambda: connect(1), size=2)
+    with pool.connection():
+        pool.check()
+    assert timeouts == [1, 3]
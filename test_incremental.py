@@ -0,0 +1,97 @@
+import os
+import threading
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LinearRegression, Ridge
+
+from incremental import update_bundle
+from model_registry import Bundle
+from prediction import FEATURE_COLUMNS, TARGET
+from train import iqr_bounds, save_bundle
+
+# Population tracks Year almost linearly in maize_data.csv, so the centered
+# features are close to rank-deficient: the case where a solver that differs
+# from scikit-learn's drifts once the model is pushed past the observed years.
+DATA = pd.read_csv(os.path.join(os.path.dirname(__file__), "maize_data.csv"))
+HISTORY, BATCH = DATA.iloc[:950], DATA.iloc[950:]
+
+
+def scenarios():
+    # Observed rows plus every year up to a decade past the data.
+    rng = np.random.default_rng(0)
+    years = np.arange(DATA["Year"].min(), DATA["Year"].max() + 11)
+    rows = DATA[FEATURE_COLUMNS].sample(len(years), random_state=0).to_numpy(dtype=float)
+    rows[:, 0] = years
+    rows[:, 1:] *= rng.normal(1.0, 0.02, size=rows[:, 1:].shape)
+    return np.vstack([DATA[FEATURE_COLUMNS].to_numpy(dtype=float), rows])
+
+
+def publish(tmp_path, estimator, bounds=True):
+    path = str(tmp_path / "model.pkl")
+    model = estimator.fit(HISTORY[FEATURE_COLUMNS], HISTORY[TARGET])
+    metadata = {"metrics": {"mae": 1.0, "r2": 1.0}}
+    if bounds:
+        metadata["outlier_bounds"] = iqr_bounds(HISTORY)
+    save_bundle({"model": model, "data": HISTORY, "interval": {"lower": -1.0, "upper": 1.0},
+                 "metadata": metadata}, path)
+    return path
+
+
+def published_model(path):
+    return Bundle(joblib.load(path), path)["model"]
+
+
+@pytest.mark.parametrize("estimator", [LinearRegression, lambda: Ridge(alpha=10.0)])
+def test_update_matches_refit(tmp_path, estimator):
+    path = publish(tmp_path, estimator())
+    update_bundle(BATCH.iloc[:20], path)
+    # The second update starts from the stored stats, not the history.
+    update_bundle(BATCH.iloc[20:], path)
+
+    refit = estimator().fit(DATA[FEATURE_COLUMNS], DATA[TARGET])
+    features = pd.DataFrame(scenarios(), columns=FEATURE_COLUMNS)
+    np.testing.assert_allclose(published_model(path).predict(features), refit.predict(features), rtol=1e-6)
+
+
+def test_drops_split_scores(tmp_path):
+    path = publish(tmp_path, LinearRegression())
+    metadata = update_bundle(BATCH, path)
+    bundle = joblib.load(path)
+    assert "interval" not in bundle
+    assert "metrics" not in metadata and "metrics" not in bundle["metadata"]
+    assert metadata["in_sample"]["r2"] == pytest.approx(
+        LinearRegression().fit(DATA[FEATURE_COLUMNS], DATA[TARGET]).score(DATA[FEATURE_COLUMNS], DATA[TARGET]))
+
+
+@pytest.mark.parametrize("bounds", [True, False])
+def test_rejects_outliers(tmp_path, bounds):
+    # A mistyped price is dropped by the training IQR limits (stored, or
+    # taken from the history for bundles trained before they were).
+    typo = BATCH.copy()
+    typo.iloc[0, typo.columns.get_loc(TARGET)] *= 100
+    (tmp_path / "clean").mkdir()
+    clean = publish(tmp_path / "clean", LinearRegression())
+    update_bundle(BATCH.iloc[1:], clean)
+    path = publish(tmp_path, LinearRegression(), bounds)
+    metadata = update_bundle(typo, path)
+
+    assert metadata["rows_rejected"] == 1
+    np.testing.assert_allclose(published_model(path).coef_, published_model(clean).coef_)
+
+
+def test_concurrent_updates_keep_every_batch(tmp_path):
+    path = publish(tmp_path, LinearRegression())
+    batches = [BATCH.iloc[i::8] for i in range(8)]
+    threads = [threading.Thread(target=update_bundle, args=(batch, path)) for batch in batches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    bundle = Bundle(joblib.load(path), path)
+    assert bundle["stats"]["n"] == len(DATA)
+    assert len(bundle["data_appends"]) == len(batches)
+    assert len(bundle["data"]) == len(DATA)
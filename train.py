@@ -0,0 +1,241 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+from sklearn.linear_model import LinearRegression, Ridge
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from sklearn.model_selection import KFold, train_test_split
+
+from model_registry import data_path, file_hash
+from prediction import FEATURE_COLUMNS, TARGET, conformal_offsets
+
+# ----------------- CONFIG -----------------
+DATA_FILE = "maize_data.csv"
+MODEL_FILE = "model.pkl"
+OUTLIER_COLUMNS = ["Cost_Tsh_per_kg", "Rainfall_mm", "Total_Production_MT"]
+SEED = 42
+TEST_SIZE = 0.2
+CHUNK_ROWS = 250_000
+CV_FOLDS = 5
+
+
+def candidates(seed=SEED):
+    # Model families and small hyperparameter grids compared by model selection.
+    # Each estimator is single-threaded; parallelism comes from running every
+    # (candidate, fold) pair as its own job.
+    return {
+        "linear": LinearRegression(),
+        "ridge_1": Ridge(alpha=1.0),
+        "ridge_10": Ridge(alpha=10.0),
+        "random_forest_d8": RandomForestRegressor(n_estimators=200, max_depth=8, random_state=seed, n_jobs=1),
+        "random_forest_full": RandomForestRegressor(n_estimators=200, random_state=seed, n_jobs=1),
+        "gbm_d2": GradientBoostingRegressor(max_depth=2, learning_rate=0.05, n_estimators=300, random_state=seed),
+        "gbm_d3": GradientBoostingRegressor(max_depth=3, learning_rate=0.1, n_estimators=200, random_state=seed),
+    }
+
+
+class StageTimer:
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def __call__(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round(time.perf_counter() - started, 6)
+
+
+# ----------------- PIPELINE -----------------
+def load_data(path, chunk_rows=CHUNK_ROWS):
+    # Chunked read; duplicates are dropped per chunk first so the final
+    # frame-wide pass only sees what survives.
+    columns = FEATURE_COLUMNS + [TARGET]
+    chunks = [chunk.dropna().drop_duplicates()
+              for chunk in pd.read_csv(path, usecols=columns, chunksize=chunk_rows)]
+    return pd.concat(chunks, ignore_index=True).drop_duplicates(ignore_index=True)
+
+
+def iqr_bounds(frame, columns=OUTLIER_COLUMNS, k=1.5):
+    # Single pass over all columns: one quantile computation for every limit.
+    values = frame[columns].to_numpy(dtype=float)
+    q1, q3 = np.quantile(values, [0.25, 0.75], axis=0)
+    iqr = q3 - q1
+    return {"columns": list(columns), "lower": (q1 - k * iqr).tolist(), "upper": (q3 + k * iqr).tolist()}
+
+
+def iqr_mask(frame, columns=OUTLIER_COLUMNS, k=1.5, bounds=None):
+    # One boolean mask instead of filtering and copying the frame once per
+    # column. `bounds` from iqr_bounds() applies limits fixed earlier (the
+    # training data's) instead of the frame's own.
+    if bounds is None:
+        bounds = iqr_bounds(frame, columns, k)
+    values = frame[bounds["columns"]].to_numpy(dtype=float)
+    return ((values >= bounds["lower"]) & (values <= bounds["upper"])).all(axis=1)
+
+
+def remove_outliers(frame, columns=OUTLIER_COLUMNS, bounds=None):
+    return frame[iqr_mask(frame, columns, bounds=bounds)].reset_index(drop=True)
+
+
+def evaluate(y_true, y_pred):
+    return {
+        "mae": float(mean_absolute_error(y_true, y_pred)),
+        "mse": float(mean_squared_error(y_true, y_pred)),
+        "r2": float(r2_score(y_true, y_pred)),
+    }
+
+
+def _score_fold(name, estimator, X, y, train_idx, test_idx):
+    model = clone(estimator).fit(X[train_idx], y[train_idx])
+    return name, evaluate(y[test_idx], model.predict(X[test_idx]))
+
+
+def select_model(X, y, models, folds=CV_FOLDS, seed=SEED, n_jobs=-1):
+    # Cross-validates every candidate in parallel across all cores and
+    # returns (best name, per-candidate mean scores). Best = lowest MAE,
+    # ties broken by higher R².
+    splits = list(KFold(n_splits=folds, shuffle=True, random_state=seed).split(X))
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_score_fold)(name, estimator, X, y, train_idx, test_idx)
+        for name, estimator in models.items()
+        for train_idx, test_idx in splits
+    )
+    scores = {}
+    for name, fold_scores in results:
+        scores.setdefault(name, []).append(fold_scores)
+    summary = {
+        name: {metric: float(np.mean([fold[metric] for fold in per_fold])) for metric in per_fold[0]}
+        for name, per_fold in scores.items()
+    }
+    best = min(summary, key=lambda name: (summary[name]["mae"], -summary[name]["r2"]))
+    return best, summary
+
+
+def fit(data, seed=SEED, test_size=TEST_SIZE, models=None, n_jobs=-1, features=FEATURE_COLUMNS):
+    X = data[features]
+    y = data[TARGET]
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=seed)
+    models = models or candidates(seed)
+    best, cv_scores = select_model(X_train.to_numpy(dtype=float), y_train.to_numpy(dtype=float),
+                                   models, seed=seed, n_jobs=n_jobs)
+    model = clone(models[best])
+    model.fit(X_train, y_train)
+    y_pred = model.predict(X_test)
+    return model, best, evaluate(y_test, y_pred), conformal_offsets(y_test, y_pred), cv_scores
+
+
+def _atomic_write(path, write):
+    # Written to a temp file and renamed so running workers never see a
+    # half-written artifact.
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def save_bundle(bundle, path=MODEL_FILE):
+    # Split artifact: the model, interval and metadata stay in the small
+    # model.pkl; the training frame goes to model.data.npy (memory-mappable)
+    # and is written first, so a new model.pkl never points at missing data.
+    bundle = dict(bundle)
+    data = bundle.pop("data", None)
+    if data is not None:
+        npy_path = data_path(path)
+
+        def write_npy(tmp_path):
+            with open(tmp_path, "wb") as f:
+                np.save(f, data.to_records(index=False))
+
+        _atomic_write(npy_path, write_npy)
+        bundle["data_file"] = os.path.basename(npy_path)
+    _atomic_write(path, lambda tmp_path: joblib.dump(bundle, tmp_path))
+
+
+def split_artifact(path=MODEL_FILE):
+    # Converts an older all-in-one model.pkl into the split layout.
+    save_bundle(joblib.load(path), path)
+
+
+def train(data_path=DATA_FILE, out=MODEL_FILE, seed=SEED, chunk_rows=CHUNK_ROWS, only=None, n_jobs=-1):
+    # Created up front so a bad --out fails before the (slow) fit, not after.
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    np.random.seed(seed)
+    stage = StageTimer()
+    with stage("load"):
+        raw = load_data(data_path, chunk_rows)
+    with stage("outliers"):
+        bounds = iqr_bounds(raw)
+        data = remove_outliers(raw, bounds=bounds)
+    models = candidates(seed)
+    if only:
+        models = {name: models[name] for name in only}
+    with stage("fit"):
+        model, best, metrics, interval, cv_scores = fit(data, seed, models=models, n_jobs=n_jobs)
+
+    metadata = {
+        "trained_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "data_file": os.path.basename(data_path),
+        "data_hash": file_hash(data_path),
+        "rows_raw": int(len(raw)),
+        "rows_used": int(len(data)),
+        "outlier_bounds": bounds,
+        "features": FEATURE_COLUMNS,
+        "target": TARGET,
+        "seed": seed,
+        "estimator": type(model).__name__,
+        "candidate": best,
+        "sklearn_version": sklearn.__version__,
+        "metrics": metrics,
+        "cv_scores": cv_scores,
+        "interval": interval,
+        "timings": stage.timings,
+    }
+    with stage("save"):
+        save_bundle({"model": model, "data": data, "interval": interval, "metadata": metadata}, out)
+    metadata["timings"] = stage.timings
+    metadata["model_hash"] = file_hash(out)
+    return metadata
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the AgriPrice maize price model.")
+    parser.add_argument("--data", default=DATA_FILE, help="training CSV in the maize_data.csv layout")
+    parser.add_argument("--out", default=MODEL_FILE, help="where to write the model bundle")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--candidates", help="comma-separated subset of: " + ", ".join(candidates()))
+    parser.add_argument("--jobs", type=int, default=-1, help="parallel CV jobs (-1 = all cores)")
+    parser.add_argument("--split-only", action="store_true",
+                        help="only rewrite an existing --out bundle into the split artifact layout")
+    args = parser.parse_args(argv)
+
+    if args.split_only:
+        split_artifact(args.out)
+        return
+
+    only = args.candidates.split(",") if args.candidates else None
+    metadata = train(args.data, args.out, args.seed, args.chunk_rows, only, args.jobs)
+    print(json.dumps(metadata, indent=2))
+
+
+if __name__ == "__main__":
+    main()